@@ -0,0 +1,74 @@
+import gzip
+import json
+import os
+from typing import Dict
+
+from metrics import metrics
+
+
+class RoundArchive:
+    """Finished rounds, one gzipped JSON file each, under data/archive/<guild_id>/.
+
+    Each guild also has an index.json with the name and tournament of every
+    archived round, so lookups by ID or name never open the round files.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _guild_dir(self, guild_id: int) -> str:
+        return os.path.join(self.directory, str(guild_id))
+
+    def _round_file(self, guild_id: int, round_id: str) -> str:
+        return os.path.join(self._guild_dir(guild_id), f"{round_id}.json.gz")
+
+    def _index_file(self, guild_id: int) -> str:
+        return os.path.join(self._guild_dir(guild_id), "index.json")
+
+    def index(self, guild_id: int) -> Dict[str, Dict]:
+        """Get {round_id: {"name", "tournament_id", "archived_at"}} of a guild's archived rounds"""
+        filepath = self._index_file(guild_id)
+        if not os.path.exists(filepath):
+            return {}
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_index(self, guild_id: int, index: Dict[str, Dict]):
+        filepath = self._index_file(guild_id)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, filepath)
+
+    def write(self, guild_id: int, round_id: str, payload: Dict, info: Dict):
+        """Store a round's payload and add it to the index"""
+        if not os.path.exists(self._guild_dir(guild_id)):
+            os.makedirs(self._guild_dir(guild_id))
+
+        filepath = self._round_file(guild_id, round_id)
+        tmp_path = filepath + ".tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False)
+        metrics.inc("storage_bytes_written_total", os.path.getsize(tmp_path))
+        os.replace(tmp_path, filepath)
+
+        # The index is written last, a crash before it leaves a harmless orphan file
+        index = self.index(guild_id)
+        index[round_id] = info
+        self._save_index(guild_id, index)
+
+    def read(self, guild_id: int, round_id: str) -> Dict:
+        filepath = self._round_file(guild_id, round_id)
+        metrics.inc("storage_bytes_read_total", os.path.getsize(filepath))
+        with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def delete(self, guild_id: int, round_id: str):
+        """Remove a round that went back to live storage"""
+        index = self.index(guild_id)
+        index.pop(round_id, None)
+        self._save_index(guild_id, index)
+
+        filepath = self._round_file(guild_id, round_id)
+        if os.path.exists(filepath):
+            os.remove(filepath)
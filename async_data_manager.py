@@ -0,0 +1,293 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from data_manager import DataManager
+from metrics import metrics
+
+# Queued predictions are written after this many seconds or once this many are pending
+PREDICTION_BATCH_INTERVAL = 0.05
+PREDICTION_BATCH_SIZE = 500
+# A failed batch is retried after a delay that doubles per failure up to this many seconds
+PREDICTION_RETRY_MAX_DELAY = 30
+
+
+class AsyncDataManager:
+    """Async facade over DataManager for use from the bot's event loop.
+
+    Every call runs on a single dedicated worker thread, so disk I/O never
+    blocks the gateway and DataManager state is only touched from one thread.
+    Predictions from reactions are queued and written in batches, see
+    submit_prediction().
+
+    Handlers that read, decide and then write (check that a round is open,
+    then save a vote) hold round_lock() for that round, and creation of
+    tournaments and rounds holds guild_lock(). Different rounds and guilds
+    never wait on each other.
+    """
+
+    def __init__(self, dm: DataManager, batch_interval=PREDICTION_BATCH_INTERVAL, batch_size=PREDICTION_BATCH_SIZE):
+        self.dm = dm
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="data-manager")
+
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        # (round_id, match_id, user_id) -> prediction, later votes overwrite earlier ones
+        self._pending = {}
+        self._flush_timer = None
+        self._flush_tasks = set()
+        self._flush_failures = 0
+        # Created on first use so it binds to the bot's running loop
+        self._flush_lock = None
+        # Locks disappear once no handler holds or waits for them
+        self._locks = weakref.WeakValueDictionary()
+
+        metrics.gauge("prediction_queue_depth", lambda: len(self._pending))
+        self._in_flight = 0
+        metrics.gauge("data_manager_calls_in_flight", lambda: self._in_flight)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        # Includes the wait for the worker thread, not just the call itself
+        self._in_flight += 1
+        try:
+            with metrics.timer("data_manager_call_seconds", call=func.__name__):
+                return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+        finally:
+            self._in_flight -= 1
+
+    def _lock(self, key) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def round_lock(self, round_id: str) -> asyncio.Lock:
+        """Lock serializing multi-step changes to one round"""
+        return self._lock(("round", round_id))
+
+    def guild_lock(self, guild_id: int) -> asyncio.Lock:
+        """Lock serializing creation of tournaments and rounds in one guild"""
+        return self._lock(("guild", guild_id))
+
+    async def flush(self):
+        """Write all pending changes to storage"""
+        await self.flush_predictions()
+        await self._run(self.dm.flush)
+
+    async def close(self):
+        """Flush pending changes and stop the worker thread"""
+        try:
+            await self.flush_predictions()
+        finally:
+            # Also drops the retry a failed final flush scheduled
+            self._cancel_flush_timer()
+            try:
+                await self._run(self.dm.close)
+            finally:
+                self._executor.shutdown()
+
+    async def evict_idle_guilds(self, max_idle: float) -> int:
+        """Drop guilds not accessed for max_idle seconds from memory"""
+        await self.flush_predictions()
+        return await self._run(self.dm.evict_idle_guilds, max_idle)
+
+    async def archive_rounds(self, max_age: float) -> int:
+        """Move finished rounds older than max_age seconds to the archive"""
+        await self.flush_predictions()
+        return await self._run(self.dm.archive_rounds, max_age)
+
+    async def next_tournament_id(self, guild_id: int) -> str:
+        return await self._run(self.dm.next_tournament_id, guild_id)
+
+    async def next_round_id(self, guild_id: int) -> str:
+        return await self._run(self.dm.next_round_id, guild_id)
+
+    # Tournament management
+    async def create_tournament(self, tournament_id: str, name: str, guild_id: int) -> Dict:
+        return await self._run(self.dm.create_tournament, tournament_id, name, guild_id)
+
+    async def create_round(self, round_id: str, name: str, guild_id: int, tournament_id: Optional[str] = None) -> Dict:
+        return await self._run(self.dm.create_round, round_id, name, guild_id, tournament_id)
+
+    async def add_match(self, round_id: str, team1: str, team2: str) -> Dict:
+        return await self._run(self.dm.add_match, round_id, team1, team2)
+
+    async def add_matches(self, round_id: str, pairings: List[Tuple[str, str]]) -> List[Dict]:
+        return await self._run(self.dm.add_matches, round_id, pairings)
+
+    async def set_match_message_id(self, round_id: str, match_index: int, message_id: int,
+                                   channel_id: Optional[int] = None):
+        await self._run(self.dm.set_match_message_id, round_id, match_index, message_id, channel_id)
+
+    async def set_match_message_ids(self, round_id: str, message_ids: Dict[int, int], channel_id: Optional[int] = None):
+        await self._run(self.dm.set_match_message_ids, round_id, message_ids, channel_id)
+
+    async def close_predictions(self, round_id: str):
+        # Votes accepted before the deadline must land before the round closes
+        await self.flush_predictions()
+        await self._run(self.dm.close_predictions, round_id)
+
+    async def set_match_result(self, round_id: str, match_index: int, winner: str):
+        await self._run(self.dm.set_match_result, round_id, match_index, winner)
+
+    async def get_round(self, round_id: str) -> Optional[Dict]:
+        return await self._run(self.dm.get_round, round_id)
+
+    async def get_tournament(self, tournament_id: str) -> Optional[Dict]:
+        return await self._run(self.dm.get_tournament, tournament_id)
+
+    async def find_match_by_message(self, guild_id: int, message_id: int) -> Optional[Tuple[str, int]]:
+        """Get (round_id, match_index) for a match message.
+
+        Once the guild is loaded this is a single dict lookup, which is safe
+        from any thread, so reactions on unrelated messages never wait for the worker.
+        """
+        guild = self.dm.loaded_guild(guild_id)
+        if guild is not None:
+            return guild.message_index.get(message_id)
+        return await self._run(self.dm.find_match_by_message, guild_id, message_id)
+
+    async def get_open_matches(self, guild_id: int) -> List[Tuple[str, int, Dict]]:
+        return await self._run(self.dm.get_open_matches, guild_id)
+
+    async def get_all_rounds(self, guild_id: int) -> List[Dict]:
+        return await self._run(self.dm.get_all_rounds, guild_id)
+
+    async def get_active_round(self, guild_id: int) -> Optional[Dict]:
+        return await self._run(self.dm.get_active_round, guild_id)
+
+    def search_rounds(self, guild_id: int, query: str, limit=25) -> List[Dict]:
+        """Find a guild's rounds for autocomplete, straight from its in-memory index.
+
+        Runs on the calling thread, so keystrokes never queue behind the worker.
+        A guild that isn't loaded has no suggestions rather than being loaded.
+        """
+        guild = self.dm.loaded_guild(guild_id)
+        return self.dm.rounds_matching(guild, query, limit) if guild is not None else []
+
+    def search_tournaments(self, guild_id: int, query: str, limit=25) -> List[Dict]:
+        """Find a guild's tournaments for autocomplete, see search_rounds()"""
+        guild = self.dm.loaded_guild(guild_id)
+        return self.dm.tournaments_matching(guild, query, limit) if guild is not None else []
+
+    # Prediction management
+    async def save_prediction(self, round_id: str, match_id: str, user_id: int, prediction: str):
+        await self._run(self.dm.save_prediction, round_id, match_id, user_id, prediction)
+
+    async def save_predictions(self, predictions: List[Tuple[str, str, int, str]]):
+        """Save a batch of (round_id, match_id, user_id, prediction) in one commit"""
+        await self._run(self.dm.save_predictions, predictions)
+
+    def submit_prediction(self, round_id: str, match_id: str, user_id: int, prediction: str):
+        """Queue a prediction to be saved with the next batch.
+
+        Votes are coalesced per user and match, so only the latest one is written.
+        """
+        self._pending[(round_id, match_id, user_id)] = prediction
+        # While storage is failing, wait for the retry instead of flushing on size
+        if len(self._pending) >= self.batch_size and not self._flush_failures:
+            self._schedule_flush(0)
+        else:
+            self._schedule_flush(self._retry_delay())
+
+    def _schedule_flush(self, delay: float):
+        if self._flush_timer is not None:
+            if delay > 0:
+                return
+            self._flush_timer.cancel()
+        self._flush_timer = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _cancel_flush_timer(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def _retry_delay(self) -> float:
+        return min(self.batch_interval * 2 ** self._flush_failures, PREDICTION_RETRY_MAX_DELAY)
+
+    def _start_flush(self):
+        self._flush_timer = None
+        task = asyncio.ensure_future(self.flush_predictions())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._on_flush_done)
+
+    def _on_flush_done(self, task: asyncio.Task):
+        self._flush_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Failed to save predictions: {task.exception()}")
+
+    async def flush_predictions(self):
+        """Write all queued predictions in one batch"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            batch, self._pending = self._pending, {}
+            metrics.observe("prediction_batch_size", len(batch))
+            records = [(round_id, match_id, user_id, prediction)
+                       for (round_id, match_id, user_id), prediction in batch.items()]
+            try:
+                await self._run(self.dm.save_predictions, records)
+            except Exception:
+                # Requeue the batch unless newer votes replaced it meanwhile
+                for key, prediction in batch.items():
+                    self._pending.setdefault(key, prediction)
+                self._flush_failures += 1
+                metrics.inc("prediction_flush_failures_total")
+                # Without a retry the batch would wait for the next vote or read
+                self._schedule_flush(self._retry_delay())
+                raise
+            self._flush_failures = 0
+
+    async def get_user_predictions(self, round_id: str, user_id: int) -> Dict:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_user_predictions, round_id, user_id)
+
+    async def get_prediction(self, round_id: str, match_id: str, user_id: int) -> Optional[str]:
+        """Get a user's latest prediction for one match, including queued ones"""
+        queued = self._pending.get((round_id, match_id, user_id))
+        if queued is not None:
+            return queued
+        return await self._run(self.dm.get_prediction, round_id, match_id, user_id)
+
+    async def get_all_predictions(self, round_id: str) -> Dict:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_all_predictions, round_id)
+
+    async def get_round_leaderboard(self, round_id: str) -> List[Dict]:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_round_leaderboard, round_id)
+
+    async def get_tournament_leaderboard(self, tournament_id: str) -> List[Dict]:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_tournament_leaderboard, tournament_id)
+
+    async def get_round_leaderboard_page(self, round_id: str, page: int, per_page: int = 10) -> Tuple[List[Dict], int]:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_round_leaderboard_page, round_id, page, per_page)
+
+    async def get_tournament_leaderboard_page(self, tournament_id: str, page: int, per_page: int = 10) -> Tuple[List[Dict], int]:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_tournament_leaderboard_page, tournament_id, page, per_page)
+
+    async def leaderboard_version(self, entity_id: str) -> Optional[int]:
+        # Queued votes may move the standings
+        await self.flush_predictions()
+        return await self._run(self.dm.leaderboard_version, entity_id)
+
+    async def get_user_round_score(self, round_id: str, user_id: int) -> Optional[Dict]:
+        await self.flush_predictions()
+        return await self._run(self.dm.get_user_round_score, round_id, user_id)
+
+    async def calculate_round_leaderboard(self, round_id: str) -> List[Dict]:
+        await self.flush_predictions()
+        return await self._run(self.dm.calculate_round_leaderboard, round_id)
+
+    async def calculate_tournament_leaderboard(self, tournament_id: str) -> List[Dict]:
+        await self.flush_predictions()
+        return await self._run(self.dm.calculate_tournament_leaderboard, tournament_id)
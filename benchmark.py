@@ -0,0 +1,426 @@
+"""Synthetic load test for DataManager and the bot's handlers.
+
+Drives the real handlers from bot.py with fake payloads and interactions, so
+no Discord connection is needed. Example:
+
+    python benchmark.py --users 5000 --reactions 50000 --output before.json
+    python benchmark.py --users 5000 --reactions 50000 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List
+
+SCENARIOS = ["populate", "reactions", "load", "leaderboard", "leaderboard_burst", "my_predictions", "add_match"]
+TEAM1_EMOJI = "✅"
+TEAM2_EMOJI = "❌"
+
+
+# Fake Discord objects, just enough for the handlers in bot.py
+class FakeMessage:
+    _next_id = 10 ** 9
+
+    def __init__(self, rest_latency: float):
+        FakeMessage._next_id += 1
+        self.id = FakeMessage._next_id
+        self.rest_latency = rest_latency
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(self.rest_latency)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, rest_latency: float):
+        self.id = channel_id
+        self.rest_latency = rest_latency
+
+    async def send(self, content=None, embed=None):
+        await asyncio.sleep(self.rest_latency)
+        return FakeMessage(self.rest_latency)
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send_message(self, content=None, embed=None, ephemeral=False):
+        self.interaction.sent.append(embed or content)
+
+    async def defer(self, ephemeral=False):
+        pass
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, embed=None, ephemeral=False):
+        self.interaction.sent.append(embed or content)
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+    def get_member(self, user_id: int):
+        # Every player is a cached member, so leaderboards don't go to REST
+        return SimpleNamespace(id=user_id, name=f"player{user_id}")
+
+
+class FakeInteraction:
+    def __init__(self, guild: FakeGuild, channel: FakeChannel, user_id: int, rest_latency: float):
+        self.guild = guild
+        self.channel = channel
+        self.user = SimpleNamespace(id=user_id)
+        self.rest_latency = rest_latency
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.sent = []
+
+    @property
+    def channel_id(self):
+        return self.channel.id
+
+    @property
+    def guild_id(self):
+        return self.guild.id
+
+    async def original_response(self):
+        return FakeMessage(self.rest_latency)
+
+
+class FakeRemovals:
+    """Stands in for ReactionRemovalQueue and counts removals instead of calling Discord"""
+
+    def __init__(self):
+        self.count = 0
+
+    def remove(self, channel_id, message_id, emoji, user_id):
+        self.count += 1
+
+    def qsize(self):
+        return 0
+
+    async def close(self):
+        pass
+
+
+# Measurements
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))]
+
+
+def summarize(latencies: List[float], elapsed: float, **extra) -> Dict:
+    result = {
+        "ops": len(latencies),
+        "elapsed_s": round(elapsed, 4),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        # ru_maxrss is in KB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if tracemalloc.is_tracing():
+        result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+    result.update(extra)
+    return result
+
+
+async def timed(latencies: List[float], coro):
+    start = time.perf_counter()
+    await coro
+    latencies.append(time.perf_counter() - start)
+
+
+class Benchmark:
+    def __init__(self, args, bot_module):
+        self.args = args
+        self.bot = bot_module
+        self.rng = random.Random(args.seed)
+        self.guilds = []  # (guild_id, [round_id, ...])
+        self.messages = []  # (guild_id, round_id, match_id, message_id)
+
+    @property
+    def dm(self):
+        return self.bot.dm
+
+    def interaction(self, guild_id: int, user_id: int) -> FakeInteraction:
+        return FakeInteraction(FakeGuild(guild_id), FakeChannel(guild_id, self.args.rest_latency),
+                               user_id, self.args.rest_latency)
+
+    async def populate(self) -> Dict:
+        """Create guilds, tournaments, rounds and matches through the async DataManager"""
+        latencies = []
+        start = time.perf_counter()
+        for g in range(self.args.guilds):
+            guild_id = 100000 + g
+            tournament_id = await self.dm.next_tournament_id(guild_id)
+            await timed(latencies, self.dm.create_tournament(tournament_id, f"Tournament {g}", guild_id))
+
+            round_ids = []
+            for r in range(self.args.rounds):
+                round_id = await self.dm.next_round_id(guild_id)
+                await timed(latencies, self.dm.create_round(round_id, f"Round {r}", guild_id, tournament_id))
+                pairings = [(f"Team {2 * m}", f"Team {2 * m + 1}") for m in range(self.args.matches)]
+                matches = []
+                await timed(latencies, self._add_matches(round_id, pairings, matches))
+
+                # Stand-ins for the IDs of posted match messages
+                message_ids = {idx: FakeMessage(0).id for idx in range(len(matches))}
+                await timed(latencies, self.dm.set_match_message_ids(round_id, message_ids))
+                for idx, match in enumerate(matches):
+                    self.messages.append((guild_id, round_id, match["id"], message_ids[idx]))
+                round_ids.append(round_id)
+            self.guilds.append((guild_id, round_ids))
+        return summarize(latencies, time.perf_counter() - start)
+
+    async def _add_matches(self, round_id, pairings, out):
+        out.extend(await self.dm.add_matches(round_id, pairings))
+
+    async def reactions(self) -> Dict:
+        """Concurrent votes through on_raw_reaction_add, then check none were lost"""
+        args = self.args
+        payloads = []
+        expected = {}  # (round_id, match_id, user_id) -> votes sent for it
+        for _ in range(args.reactions):
+            guild_id, round_id, match_id, message_id = self.rng.choice(self.messages)
+            user_id = self.rng.randrange(1, args.users + 1)
+            emoji = self.rng.choice((TEAM1_EMOJI, TEAM2_EMOJI))
+            payloads.append(SimpleNamespace(user_id=user_id, emoji=emoji, guild_id=guild_id,
+                                            message_id=message_id, channel_id=guild_id))
+            expected.setdefault((round_id, match_id, user_id), set()).add(
+                "team1" if emoji == TEAM1_EMOJI else "team2")
+
+        latencies = []
+        tasks = []
+        start = time.perf_counter()
+        for i, payload in enumerate(payloads):
+            if args.rate:
+                # Pace arrivals at the requested rate
+                delay = start + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(timed(latencies, self.bot.on_raw_reaction_add(payload))))
+        await asyncio.gather(*tasks)
+        await self.dm.flush()
+        elapsed = time.perf_counter() - start
+
+        lost = 0
+        for round_id in {key[0] for key in expected}:
+            stored = await self.dm.get_all_predictions(round_id)
+            for (r, match_id, user_id), votes in expected.items():
+                if r == round_id and stored.get(str(user_id), {}).get(match_id) not in votes:
+                    lost += 1
+        return summarize(latencies, elapsed, lost_votes=lost, removals=self.bot.reaction_removals.count)
+
+    async def load(self) -> Dict:
+        """Cold-load every guild from storage after dropping it from memory"""
+        await self.dm.flush()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.args.iterations // 10 or 1):
+            await self.dm.evict_idle_guilds(0)
+            for guild_id, round_ids in self.guilds:
+                await timed(latencies, self.dm.get_round(round_ids[0]))
+        return summarize(latencies, time.perf_counter() - start)
+
+    async def resolve_matches(self):
+        """Set results for half of each round's matches so leaderboards have scores"""
+        for guild_id, round_ids in self.guilds:
+            for round_id in round_ids:
+                round_data = await self.dm.get_round(round_id)
+                for idx in range(0, len(round_data["matches"]), 2):
+                    await self.dm.set_match_result(round_id, idx, self.rng.choice(("team1", "team2")))
+
+    async def leaderboard(self) -> Dict:
+        await self.resolve_matches()
+        latencies = []
+        start = time.perf_counter()
+        for i in range(self.args.iterations):
+            guild_id, round_ids = self.rng.choice(self.guilds)
+            interaction = self.interaction(guild_id, self.rng.randrange(1, self.args.users + 1))
+            page = self.rng.randrange(1, max(2, self.args.users // 10))
+            if i % 2:
+                tournament_id = (await self.dm.get_round(round_ids[0]))["tournament_id"]
+                call = self.bot.leaderboard.callback(interaction, tournament_id=tournament_id, page=page)
+            else:
+                call = self.bot.leaderboard.callback(interaction, round_id=self.rng.choice(round_ids), page=page)
+            await timed(latencies, call)
+        return summarize(latencies, time.perf_counter() - start)
+
+    async def leaderboard_burst(self) -> Dict:
+        """Many users asking for the same leaderboard right after each result"""
+        misses = self.bot.metrics.counter("leaderboard_cache_total", result="miss")
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(max(1, self.args.iterations // self.args.burst)):
+            guild_id, round_ids = self.rng.choice(self.guilds)
+            round_id = self.rng.choice(round_ids)
+            round_data = await self.dm.get_round(round_id)
+            await self.dm.set_match_result(round_id, self.rng.randrange(len(round_data["matches"])),
+                                           self.rng.choice(("team1", "team2")))
+            await asyncio.gather(*(
+                timed(latencies, self.bot.leaderboard.callback(
+                    self.interaction(guild_id, self.rng.randrange(1, self.args.users + 1)), round_id=round_id
+                ))
+                for _ in range(self.args.burst)
+            ))
+        renders = self.bot.metrics.counter("leaderboard_cache_total", result="miss") - misses
+        return summarize(latencies, time.perf_counter() - start, renders=int(renders))
+
+    async def my_predictions(self) -> Dict:
+        for guild_id, round_ids in self.guilds:
+            for round_id in round_ids:
+                await self.dm.close_predictions(round_id)
+
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(self.args.iterations):
+            guild_id, round_ids = self.rng.choice(self.guilds)
+            interaction = self.interaction(guild_id, self.rng.randrange(1, self.args.users + 1))
+            await timed(latencies, self.bot.my_predictions.callback(interaction, self.rng.choice(round_ids)))
+        return summarize(latencies, time.perf_counter() - start)
+
+    async def add_match(self) -> Dict:
+        # Matches go to fresh rounds so the earlier scenarios' data isn't touched
+        round_ids = []
+        for guild_id, _ in self.guilds:
+            round_id = await self.dm.next_round_id(guild_id)
+            await self.dm.create_round(round_id, "Benchmark", guild_id)
+            round_ids.append((guild_id, round_id))
+
+        latencies = []
+        start = time.perf_counter()
+        for i in range(self.args.iterations):
+            guild_id, round_id = round_ids[i % len(round_ids)]
+            interaction = self.interaction(guild_id, 1)
+            await timed(latencies, self.bot.add_match.callback(interaction, round_id, f"Team {i}", f"Team {i + 1}"))
+        return summarize(latencies, time.perf_counter() - start)
+
+
+async def run(args, bot_module) -> Dict:
+    bench = Benchmark(args, bot_module)
+    results = {}
+    # populate is always needed, the others build on its data and each other's
+    # in this order (my_predictions closes the rounds reactions vote in)
+    scenarios = [name for name in SCENARIOS if name == "populate" or name in args.scenarios]
+    for name in scenarios:
+        if args.tracemalloc:
+            tracemalloc.start()
+        results[name] = await getattr(bench, name)()
+        if args.tracemalloc:
+            tracemalloc.stop()
+        print(format_result(name, results[name]))
+    await bot_module.dm.close()
+    return results
+
+
+def format_result(name: str, result: Dict) -> str:
+    line = (f"{name:<17} {result['ops']:>8} ops  {result['throughput_per_s']:>10.1f}/s  "
+            f"p50 {result['p50_ms']:>8.3f}ms  p95 {result['p95_ms']:>8.3f}ms  p99 {result['p99_ms']:>8.3f}ms  "
+            f"rss {result['peak_rss_mb']:.1f}MB")
+    if "peak_traced_mb" in result:
+        line += f"  traced {result['peak_traced_mb']:.1f}MB"
+    if "renders" in result:
+        line += f"  renders {result['renders']}"
+    if "lost_votes" in result:
+        line += f"  lost {result['lost_votes']}"
+    return line
+
+
+def compare(results: Dict, previous: Dict):
+    """Print throughput and p95 changes against an earlier run"""
+    print(f"\nCompared to {previous.get('timestamp', 'previous run')}:")
+    for name, result in results.items():
+        before = previous["results"].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("throughput_per_s", "p95_ms"):
+            if before[key]:
+                changes.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+.1f}%")
+        print(f"{name:<17} " + "  ".join(changes))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test DataManager and the bot handlers without Discord")
+    parser.add_argument("--guilds", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=2, help="rounds per guild")
+    parser.add_argument("--matches", type=int, default=16, help="matches per round")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--reactions", type=int, default=20000, help="reaction events to send")
+    parser.add_argument("--rate", type=float, default=0, help="reactions per second, 0 sends them all at once")
+    parser.add_argument("--iterations", type=int, default=500, help="calls per command scenario")
+    parser.add_argument("--burst", type=int, default=50, help="concurrent calls per leaderboard_burst round")
+    parser.add_argument("--rest-latency", type=float, default=0, help="simulated Discord REST latency in seconds")
+    parser.add_argument("--backend", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tracemalloc", action="store_true", help="report peak traced memory per scenario (slower)")
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+
+    # bot.py opens ./data on import, so run from a scratch directory
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="prediction-bench-")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    try:
+        import bot as bot_module
+        from async_data_manager import AsyncDataManager
+        from data_manager import DataManager
+        from storage import create_storage
+
+        data_dir = os.path.join(workdir, "bench-data")
+        bot_module.dm = AsyncDataManager(DataManager(data_dir, storage=create_storage(args.backend, data_dir)))
+        bot_module.reaction_removals = FakeRemovals()
+        # on_raw_reaction_add compares against the logged-in user
+        bot_module.bot._connection.user = SimpleNamespace(id=0)
+
+        results = asyncio.run(run(args, bot_module))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": results,
+    }
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {output}")
+    if previous:
+        compare(results, previous)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
+import asyncio
+import re
+import time
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import os
 from dotenv import load_dotenv
 from data_manager import DataManager
-from typing import Optional
+from async_data_manager import AsyncDataManager
+from name_resolver import NameResolver
+from reactions import ReactionRemovalQueue
+from catchup import ReactionCatchUp
+from command_sync import CommandSync
+import cluster
+from leaderboard_cache import LeaderboardCache
+from metrics import metrics
+from typing import Dict, List, Optional, Tuple
 
 load_dotenv()
 
@@ -13,13 +24,90 @@ intents.message_content = True
 intents.reactions = True
 intents.members = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
-dm = DataManager()
+class InstrumentedTree(app_commands.CommandTree):
+    """Command tree that times every slash command"""
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        record_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+def record_command(interaction: discord.Interaction, status: str):
+    started = interaction.extras.get("started")
+    if started is not None and interaction.command:
+        metrics.observe("command_seconds", time.perf_counter() - started,
+                        command=interaction.command.name, status=status)
+
+
+# Set for each worker by "python cluster.py launch", see README "Running several processes"
+STORAGE_WRITER_ADDRESS = os.getenv("STORAGE_WRITER_ADDRESS")
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id]
+WORKER_ID = os.getenv("WORKER_ID")
+# Work done once for all workers (command sync, archiving) happens on the one running shard 0
+PRIMARY_WORKER = not SHARD_IDS or 0 in SHARD_IDS
+
+
+class PredictionBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    async def close(self):
+        await super().close()
+        await reaction_removals.close()
+        # Write out queued predictions before the process exits
+        await dm.close()
+
+
+shard_options = {"shard_count": int(SHARD_COUNT), "shard_ids": SHARD_IDS or None} if SHARD_COUNT else {}
+bot = PredictionBot(command_prefix="!", intents=intents, tree_cls=InstrumentedTree, **shard_options)
+if STORAGE_WRITER_ADDRESS:
+    # Changes go to the storage writer process, reads come from a local replica
+    dm = cluster.connect(STORAGE_WRITER_ADDRESS, os.getenv("STORAGE_WRITER_KEY", ""))
+else:
+    dm = AsyncDataManager(DataManager())
+names = NameResolver(bot)
+reaction_removals = ReactionRemovalQueue(bot)
+# Rendered /leaderboard pages, reused until the standings change
+leaderboard_cache = LeaderboardCache()
 
 # Emoji for predictions
 TEAM1_EMOJI = "✅"  # Checkmark for team1
 TEAM2_EMOJI = "❌"  # X for team2
 
+# Reads back votes cast while the bot was offline, see on_ready
+catch_up = ReactionCatchUp(bot, dm, {TEAM1_EMOJI: "team1", TEAM2_EMOJI: "team2"})
+# Tasks started without awaiting them, referenced until done so they aren't garbage collected
+background_tasks = set()
+
+# Slash commands are only synced with Discord when they changed
+command_sync = CommandSync(bot.tree, os.path.join(dm.dm.data_dir, "command_sync.json"))
+# When set, commands are synced to this guild only, where updates show up instantly
+DEV_GUILD_ID = os.getenv("DEV_GUILD_ID")
+
+# Players shown per leaderboard page
+LEADERBOARD_PAGE_SIZE = 10
+
+# Limits for /add_matches: matches per command, and Discord requests in flight at once
+MAX_MATCHES_PER_COMMAND = 25
+MATCH_SETUP_CONCURRENCY = 4
+
+# Guild data unused for this many seconds is dropped from memory
+GUILD_IDLE_SECONDS = 30 * 60
+
+# Finished rounds are moved to data/archive/ this many days after they finished
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+
+# Metrics are written to data/metrics.prom (metrics-<worker>.prom per worker) this often
+METRICS_WRITE_SECONDS = 60
+METRICS_FILE = f"metrics-{WORKER_ID}.prom" if WORKER_ID else "metrics.prom"
+
+# Discord allows 1024 characters per embed field and 6000 per embed; /stats
+# spreads command timings over at most this many fields
+EMBED_FIELD_LIMIT = 1024
+STATS_COMMAND_FIELDS = 3
+
 # Admin role check
 def is_admin():
     async def predicate(interaction: discord.Interaction) -> bool:
@@ -27,22 +115,110 @@ def is_admin():
     return app_commands.check(predicate)
 
 
+@tasks.loop(minutes=5)
+async def evict_idle_guilds():
+    await dm.evict_idle_guilds(GUILD_IDLE_SECONDS)
+
+
+@tasks.loop(hours=1)
+async def archive_rounds():
+    archived = await dm.archive_rounds(ARCHIVE_AFTER_DAYS * 24 * 60 * 60)
+    if archived:
+        print(f"Archived {archived} finished round(s)")
+
+
+@tasks.loop(seconds=METRICS_WRITE_SECONDS)
+async def write_metrics():
+    try:
+        metrics.write_prometheus(os.path.join(dm.dm.data_dir, METRICS_FILE))
+    except OSError as e:
+        print(f"Failed to write metrics: {e}")
+
+
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user}')
+    if not evict_idle_guilds.is_running():
+        evict_idle_guilds.start()
+    if PRIMARY_WORKER and not archive_rounds.is_running():
+        archive_rounds.start()
+    if not write_metrics.is_running():
+        write_metrics.start()
+
+    # on_ready also fires after a reconnect that couldn't resume, when
+    # reactions may have been missed; runs in the background meanwhile
+    task = asyncio.ensure_future(run_catch_up())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    if not PRIMARY_WORKER:
+        return
     try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} command(s)")
+        synced = await sync_commands_with_discord(force=os.getenv("FORCE_COMMAND_SYNC") == "1")
+        if synced is None:
+            print("Commands unchanged, skipped sync")
+        else:
+            print(f"Synced {synced} command(s)")
     except Exception as e:
         print(f"Failed to sync commands: {e}")
 
 
+async def sync_commands_with_discord(force=False) -> Optional[int]:
+    guild = discord.Object(id=int(DEV_GUILD_ID)) if DEV_GUILD_ID else None
+    if guild:
+        bot.tree.copy_global_to(guild=guild)
+    return await command_sync.sync(guild, force=force)
+
+
+async def run_catch_up():
+    try:
+        await catch_up.run([guild.id for guild in bot.guilds])
+    except Exception as e:
+        print(f"Failed to catch up on missed reactions: {e}")
+
+
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    record_command(interaction, "ok")
+
+
+def choice_name(name: str, entity_id: str, status: Optional[str] = None) -> str:
+    """Label of an autocomplete choice, within Discord's 100 character limit"""
+    suffix = f" · {entity_id}" + (f" · {status}" if status else "")
+    return name[:100 - len(suffix)] + suffix
+
+
+async def round_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    """Suggest the guild's rounds by name or ID, open rounds first"""
+    if interaction.guild is None:
+        return []
+    with metrics.timer("autocomplete_seconds", parameter="round_id"):
+        rounds = dm.search_rounds(interaction.guild.id, current)
+    return [
+        app_commands.Choice(name=choice_name(round_data["name"], round_data["id"], round_data["status"]),
+                            value=round_data["id"])
+        for round_data in rounds
+    ]
+
+
+async def tournament_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    """Suggest the guild's tournaments by name or ID"""
+    if interaction.guild is None:
+        return []
+    with metrics.timer("autocomplete_seconds", parameter="tournament_id"):
+        tournaments = dm.search_tournaments(interaction.guild.id, current)
+    return [
+        app_commands.Choice(name=choice_name(tournament["name"], tournament["id"]), value=tournament["id"])
+        for tournament in tournaments
+    ]
+
+
 @bot.tree.command(name="create_tournament", description="[ADMIN] Create a new tournament")
 @app_commands.describe(name="Tournament name")
 @is_admin()
 async def create_tournament(interaction: discord.Interaction, name: str):
-    tournament_id = f"tournament_{interaction.guild.id}_{len(dm._load_json(dm.tournaments_file)['tournaments'])}"
-    tournament = dm.create_tournament(tournament_id, name, interaction.guild.id)
+    async with dm.guild_lock(interaction.guild.id):
+        tournament_id = await dm.next_tournament_id(interaction.guild.id)
+        tournament = await dm.create_tournament(tournament_id, name, interaction.guild.id)
 
     embed = discord.Embed(
         title="🏆 Tournament Created",
@@ -58,10 +234,12 @@ async def create_tournament(interaction: discord.Interaction, name: str):
     name="Round name",
     tournament_id="Tournament ID (leave empty for standalone round)"
 )
+@app_commands.autocomplete(tournament_id=tournament_autocomplete)
 @is_admin()
 async def create_round(interaction: discord.Interaction, name: str, tournament_id: Optional[str] = None):
-    round_id = f"round_{interaction.guild.id}_{len(dm._load_json(dm.tournaments_file)['rounds'])}"
-    round_data = dm.create_round(round_id, name, interaction.guild.id, tournament_id)
+    async with dm.guild_lock(interaction.guild.id):
+        round_id = await dm.next_round_id(interaction.guild.id)
+        round_data = await dm.create_round(round_id, name, interaction.guild.id, tournament_id)
 
     embed = discord.Embed(
         title="📋 Round Created",
@@ -70,7 +248,7 @@ async def create_round(interaction: discord.Interaction, name: str, tournament_i
     )
 
     if tournament_id:
-        tournament = dm.get_tournament(tournament_id)
+        tournament = await dm.get_tournament(tournament_id)
         if tournament:
             embed.add_field(name="Tournament", value=tournament["name"], inline=False)
 
@@ -78,59 +256,163 @@ async def create_round(interaction: discord.Interaction, name: str, tournament_i
     await interaction.response.send_message(embed=embed)
 
 
+def match_embed(round_data: Dict, match: Dict) -> discord.Embed:
+    """Build the message users react to for a match"""
+    embed = discord.Embed(
+        title="🎮 New Match",
+        description=f"**{match['team1']}** vs **{match['team2']}**",
+        color=discord.Color.gold()
+    )
+    embed.add_field(
+        name="How to predict?",
+        value=f"{TEAM1_EMOJI} = {match['team1']} wins\n{TEAM2_EMOJI} = {match['team2']} wins",
+        inline=False
+    )
+    embed.set_footer(text=f"Round: {round_data['name']} | Match ID: {match['id']}")
+    return embed
+
+
+def parse_pairings(text: str) -> List[Tuple[str, str]]:
+    """Parse "Team A vs Team B; Team C vs Team D" into [(team1, team2), ...]"""
+    pairings = []
+    for part in re.split(r"[;\n]", text):
+        if not part.strip():
+            continue
+        teams = [team.strip() for team in re.split(r"\s+vs\.?\s+", part.strip(), flags=re.IGNORECASE)]
+        if len(teams) != 2 or not all(teams):
+            raise ValueError(f"Can't read match \"{part.strip()}\", use \"Team A vs Team B\"")
+        pairings.append((teams[0], teams[1]))
+
+    if not pairings:
+        raise ValueError("No matches given")
+    if len(pairings) > MAX_MATCHES_PER_COMMAND:
+        raise ValueError(f"At most {MAX_MATCHES_PER_COMMAND} matches can be added at once")
+    return pairings
+
+
 @bot.tree.command(name="add_match", description="[ADMIN] Add a match to the current round")
 @app_commands.describe(
     round_id="Round ID",
     team1="First team name",
     team2="Second team name"
 )
+@app_commands.autocomplete(round_id=round_autocomplete)
 @is_admin()
 async def add_match(interaction: discord.Interaction, round_id: str, team1: str, team2: str):
     try:
-        match = dm.add_match(round_id, team1, team2)
-        round_data = dm.get_round(round_id)
+        async with dm.round_lock(round_id):
+            match = await dm.add_match(round_id, team1, team2)
+            round_data = await dm.get_round(round_id)
+            match_index = len(round_data["matches"]) - 1
 
         if not round_data["predictions_open"]:
             await interaction.response.send_message("⚠️ Predictions are closed for this round!", ephemeral=True)
             return
 
-        embed = discord.Embed(
-            title="🎮 New Match",
-            description=f"**{team1}** vs **{team2}**",
-            color=discord.Color.gold()
-        )
-        embed.add_field(
-            name="How to predict?",
-            value=f"{TEAM1_EMOJI} = {team1} wins\n{TEAM2_EMOJI} = {team2} wins",
-            inline=False
-        )
-        embed.set_footer(text=f"Round: {round_data['name']} | Match ID: {match['id']}")
-
-        await interaction.response.send_message(embed=embed)
+        await interaction.response.send_message(embed=match_embed(round_data, match))
         message = await interaction.original_response()
+        metrics.inc("discord_rest_calls_total", call="original_response")
 
         # Add reactions
         await message.add_reaction(TEAM1_EMOJI)
         await message.add_reaction(TEAM2_EMOJI)
+        metrics.inc("discord_rest_calls_total", 2, call="add_reaction")
 
         # Save message ID
-        match_index = len(round_data["matches"]) - 1
-        dm.set_match_message_id(round_id, match_index, message.id)
+        await dm.set_match_message_id(round_id, match_index, message.id, interaction.channel_id)
+
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
 
+
+@bot.tree.command(name="add_matches", description="[ADMIN] Add several matches to a round at once")
+@app_commands.describe(
+    round_id="Round ID",
+    matches="Matches separated by ;, e.g. Navi vs Vitality; FaZe vs G2"
+)
+@app_commands.autocomplete(round_id=round_autocomplete)
+@is_admin()
+async def add_matches(interaction: discord.Interaction, round_id: str, matches: str):
+    try:
+        pairings = parse_pairings(matches)
     except ValueError as e:
         await interaction.response.send_message(f"❌ Error: {e}", ephemeral=True)
+        return
+
+    round_data = await dm.get_round(round_id)
+    if not round_data:
+        await interaction.response.send_message("❌ Round not found", ephemeral=True)
+        return
+    if not round_data["predictions_open"]:
+        await interaction.response.send_message("⚠️ Predictions are closed for this round!", ephemeral=True)
+        return
+
+    # Posting a whole card takes longer than an interaction may go unanswered
+    await interaction.response.defer(ephemeral=True)
+
+    async with dm.round_lock(round_id):
+        added = await dm.add_matches(round_id, pairings)
+        round_data = await dm.get_round(round_id)
+        first_index = len(round_data["matches"]) - len(added)
+
+    budget = asyncio.Semaphore(MATCH_SETUP_CONCURRENCY)
+
+    async def seed_reactions(message: discord.Message):
+        async with budget:
+            await message.add_reaction(TEAM1_EMOJI)
+            await message.add_reaction(TEAM2_EMOJI)
+        metrics.inc("discord_rest_calls_total", 2, call="add_reaction")
+
+    # Messages go out one by one so the card keeps its order in the channel,
+    # reactions are seeded alongside while the next messages are sent
+    message_ids = {}
+    reaction_tasks = []
+    failed = []
+    for offset, match in enumerate(added):
+        try:
+            async with budget:
+                metrics.inc("discord_rest_calls_total", call="send_message")
+                message = await interaction.channel.send(embed=match_embed(round_data, match))
+        except discord.HTTPException as e:
+            print(f"Failed to post match {match['id']}: {e}")
+            failed.append(match)
+            continue
+        message_ids[first_index + offset] = message.id
+        reaction_tasks.append(asyncio.ensure_future(seed_reactions(message)))
+
+    # Record the messages before waiting for reactions so votes are counted right away
+    await dm.set_match_message_ids(round_id, message_ids, interaction.channel.id)
+    for result in await asyncio.gather(*reaction_tasks, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Failed to add reactions in round {round_id}: {result}")
+
+    embed = discord.Embed(
+        title="🎮 Matches Added",
+        description=f"Round: **{round_data['name']}**\n{len(message_ids)} match(es) posted",
+        color=discord.Color.gold()
+    )
+    if failed:
+        embed.add_field(
+            name="Not posted",
+            value="\n".join(f"{match['team1']} vs {match['team2']} (`{match['id']}`)" for match in failed),
+            inline=False
+        )
+    await interaction.followup.send(embed=embed, ephemeral=True)
 
 
 @bot.tree.command(name="close_predictions", description="[ADMIN] Close predictions for a round")
 @app_commands.describe(round_id="Round ID")
+@app_commands.autocomplete(round_id=round_autocomplete)
 @is_admin()
 async def close_predictions(interaction: discord.Interaction, round_id: str):
-    round_data = dm.get_round(round_id)
+    round_data = await dm.get_round(round_id)
     if not round_data:
         await interaction.response.send_message("❌ Round not found", ephemeral=True)
         return
 
-    dm.close_predictions(round_id)
+    # Waits for votes that already passed the open check
+    async with dm.round_lock(round_id):
+        await dm.close_predictions(round_id)
 
     embed = discord.Embed(
         title="🔒 Predictions Closed",
@@ -150,9 +432,10 @@ async def close_predictions(interaction: discord.Interaction, round_id: str):
     app_commands.Choice(name="Team 1", value="team1"),
     app_commands.Choice(name="Team 2", value="team2")
 ])
+@app_commands.autocomplete(round_id=round_autocomplete)
 @is_admin()
 async def set_result(interaction: discord.Interaction, round_id: str, match_number: int, winner: str):
-    round_data = dm.get_round(round_id)
+    round_data = await dm.get_round(round_id)
     if not round_data:
         await interaction.response.send_message("❌ Round not found", ephemeral=True)
         return
@@ -162,7 +445,8 @@ async def set_result(interaction: discord.Interaction, round_id: str, match_numb
         await interaction.response.send_message("❌ Invalid match number", ephemeral=True)
         return
 
-    dm.set_match_result(round_id, match_index, winner)
+    async with dm.round_lock(round_id):
+        await dm.set_match_result(round_id, match_index, winner)
     match = round_data["matches"][match_index]
 
     winner_name = match["team1"] if winner == "team1" else match["team2"]
@@ -178,13 +462,14 @@ async def set_result(interaction: discord.Interaction, round_id: str, match_numb
 
 @bot.tree.command(name="my_predictions", description="View your predictions")
 @app_commands.describe(round_id="Round ID")
+@app_commands.autocomplete(round_id=round_autocomplete)
 async def my_predictions(interaction: discord.Interaction, round_id: str):
-    round_data = dm.get_round(round_id)
+    round_data = await dm.get_round(round_id)
     if not round_data:
         await interaction.response.send_message("❌ Round not found", ephemeral=True)
         return
 
-    predictions = dm.get_user_predictions(round_id, interaction.user.id)
+    predictions = await dm.get_user_predictions(round_id, interaction.user.id)
 
     if not predictions:
         await interaction.response.send_message("You don't have any predictions for this round yet", ephemeral=True)
@@ -217,12 +502,11 @@ async def my_predictions(interaction: discord.Interaction, round_id: str):
 
     # Add score if round is finished
     if round_data["predictions_open"] == False:
-        leaderboard = dm.calculate_round_leaderboard(round_id)
-        user_score = next((s for s in leaderboard if s["user_id"] == interaction.user.id), None)
+        user_score = await dm.get_user_round_score(round_id, interaction.user.id)
         if user_score:
             embed.add_field(
                 name="Your Score",
-                value=f"{user_score['correct']}/{user_score['total']} ({user_score['percentage']}%)",
+                value=f"{user_score['correct']}/{user_score['total']} ({user_score['percentage']}%) | Rank #{user_score['rank']}",
                 inline=False
             )
 
@@ -232,20 +516,38 @@ async def my_predictions(interaction: discord.Interaction, round_id: str):
 @bot.tree.command(name="leaderboard", description="Show leaderboard")
 @app_commands.describe(
     round_id="Round ID (for round leaderboard)",
-    tournament_id="Tournament ID (for tournament leaderboard)"
+    tournament_id="Tournament ID (for tournament leaderboard)",
+    page=f"Page number ({LEADERBOARD_PAGE_SIZE} players per page)"
 )
-async def leaderboard(interaction: discord.Interaction, round_id: Optional[str] = None, tournament_id: Optional[str] = None):
+@app_commands.autocomplete(round_id=round_autocomplete, tournament_id=tournament_autocomplete)
+async def leaderboard(interaction: discord.Interaction, round_id: Optional[str] = None, tournament_id: Optional[str] = None, page: int = 1):
     if not round_id and not tournament_id:
         await interaction.response.send_message("❌ Specify round_id or tournament_id", ephemeral=True)
         return
 
-    if round_id:
-        round_data = dm.get_round(round_id)
-        if not round_data:
-            await interaction.response.send_message("❌ Round not found", ephemeral=True)
-            return
+    page = max(page, 1)
+    entity_id = round_id or tournament_id
+
+    version = await dm.leaderboard_version(entity_id)
+    if version is None:
+        await interaction.response.send_message(
+            "❌ Round not found" if round_id else "❌ Tournament not found", ephemeral=True
+        )
+        return
+
+    embed = await leaderboard_cache.get(
+        (interaction.guild_id, entity_id, page), version,
+        lambda: render_leaderboard(round_id, tournament_id, page, interaction.guild)
+    )
+    await interaction.response.send_message(embed=embed)
 
-        leaderboard_data = dm.calculate_round_leaderboard(round_id)
+
+async def render_leaderboard(round_id: Optional[str], tournament_id: Optional[str], page: int,
+                             guild: Optional[discord.Guild]) -> discord.Embed:
+    """Build one page of a round's or tournament's leaderboard"""
+    if round_id:
+        round_data = await dm.get_round(round_id)
+        leaderboard_data, players = await dm.get_round_leaderboard_page(round_id, page, LEADERBOARD_PAGE_SIZE)
 
         embed = discord.Embed(
             title="🏆 Round Leaderboard",
@@ -254,12 +556,8 @@ async def leaderboard(interaction: discord.Interaction, round_id: Optional[str]
         )
 
     else:  # tournament_id
-        tournament = dm.get_tournament(tournament_id)
-        if not tournament:
-            await interaction.response.send_message("❌ Tournament not found", ephemeral=True)
-            return
-
-        leaderboard_data = dm.calculate_tournament_leaderboard(tournament_id)
+        tournament = await dm.get_tournament(tournament_id)
+        leaderboard_data, players = await dm.get_tournament_leaderboard_page(tournament_id, page, LEADERBOARD_PAGE_SIZE)
 
         embed = discord.Embed(
             title="🏆 Tournament Leaderboard",
@@ -267,22 +565,34 @@ async def leaderboard(interaction: discord.Interaction, round_id: Optional[str]
             color=discord.Color.gold()
         )
 
-    if not leaderboard_data:
+    if not players:
         embed.add_field(name="Empty", value="No results yet", inline=False)
+    elif not leaderboard_data:
+        embed.add_field(name="Empty", value="No players on this page", inline=False)
     else:
+        user_names = await names.resolve([score["user_id"] for score in leaderboard_data], guild)
         leaderboard_text = ""
-        for i, score in enumerate(leaderboard_data[:10], 1):  # Top 10
-            user = await bot.fetch_user(score["user_id"])
-            medal = "🥇" if i == 1 else "🥈" if i == 2 else "🥉" if i == 3 else f"{i}."
-            leaderboard_text += f"{medal} **{user.name}**: {score['correct']}/{score['total']} ({score['percentage']}%)\n"
+        for score in leaderboard_data:
+            rank = score["rank"]
+            medal = "🥇" if rank == 1 else "🥈" if rank == 2 else "🥉" if rank == 3 else f"{rank}."
+            leaderboard_text += f"{medal} **{user_names[score['user_id']]}**: {score['correct']}/{score['total']} ({score['percentage']}%)\n"
 
-        embed.add_field(name="Top Players", value=leaderboard_text, inline=False)
+        embed.add_field(name="Top Players" if page == 1 else "Players", value=leaderboard_text, inline=False)
 
-    await interaction.response.send_message(embed=embed)
+    if players:
+        pages = (players + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+        embed.set_footer(text=f"Page {page}/{pages} | {players} players")
+
+    return embed
 
 
 @bot.event
 async def on_raw_reaction_add(payload):
+    with metrics.timer("reaction_handler_seconds"):
+        await handle_reaction_add(payload)
+
+
+async def handle_reaction_add(payload):
     # Ignore bot's own reactions
     if payload.user_id == bot.user.id:
         return
@@ -291,48 +601,134 @@ async def on_raw_reaction_add(payload):
     if str(payload.emoji) not in [TEAM1_EMOJI, TEAM2_EMOJI]:
         return
 
-    # Find the round and match
-    all_data = dm._load_json(dm.tournaments_file)
-    round_id = None
-    match_data = None
-    match_index = None
-
-    for rid, round_info in all_data["rounds"].items():
-        for idx, match in enumerate(round_info["matches"]):
-            if match["message_id"] == payload.message_id:
-                round_id = rid
-                match_data = match
-                match_index = idx
-                break
-        if round_id:
-            break
-
-    if not round_id or not match_data:
+    # Predictions only live in guild channels
+    if payload.guild_id is None:
         return
 
-    # Check if predictions are still open
-    round_data = dm.get_round(round_id)
-    if not round_data["predictions_open"]:
-        # Remove reaction if predictions are closed
-        channel = bot.get_channel(payload.channel_id)
-        message = await channel.fetch_message(payload.message_id)
-        user = await bot.fetch_user(payload.user_id)
-        await message.remove_reaction(payload.emoji, user)
+    # Find the round and match
+    location = await dm.find_match_by_message(payload.guild_id, payload.message_id)
+    if location is None:
         return
 
-    # Determine prediction
-    prediction = "team1" if str(payload.emoji) == TEAM1_EMOJI else "team2"
+    round_id, match_index = location
+
+    # Held until the vote is queued so close_predictions can't slip in between
+    async with dm.round_lock(round_id):
+        round_data = await dm.get_round(round_id)
+        match_data = round_data["matches"][match_index]
+
+        # Check if predictions are still open
+        if not round_data["predictions_open"]:
+            # Remove reaction if predictions are closed
+            reaction_removals.remove(payload.channel_id, payload.message_id, str(payload.emoji), payload.user_id)
+            return
+
+        # Determine prediction
+        prediction = "team1" if str(payload.emoji) == TEAM1_EMOJI else "team2"
+        previous = await dm.get_prediction(round_id, match_data["id"], payload.user_id)
+
+        # Queue prediction, it's written with the next batch
+        dm.submit_prediction(round_id, match_data["id"], payload.user_id, prediction)
+        catch_up.note_vote(match_data["id"], payload.user_id)
+
+    # Remove the opposite reaction if user already reacted with it
+    if previous and previous != prediction:
+        opposite_emoji = TEAM2_EMOJI if prediction == "team1" else TEAM1_EMOJI
+        reaction_removals.remove(payload.channel_id, payload.message_id, opposite_emoji, payload.user_id)
+
+
+def format_timings(histogram) -> str:
+    return (f"{histogram.count} calls, p50 {histogram.quantile(0.5) * 1000:.1f}ms, "
+            f"p95 {histogram.quantile(0.95) * 1000:.1f}ms")
+
+
+def add_lines_field(embed: discord.Embed, name: str, lines: List[str], max_fields: int):
+    """Add lines as embed fields of up to 1024 characters each, noting the ones that don't fit"""
+    chunks = [[]]
+    for line in lines:
+        line = line[:EMBED_FIELD_LIMIT]
+        if chunks[-1] and len("\n".join(chunks[-1] + [line])) > EMBED_FIELD_LIMIT:
+            chunks.append([])
+        chunks[-1].append(line)
 
-    # Save prediction
-    dm.save_prediction(round_id, match_data["id"], payload.user_id, prediction)
+    if len(chunks) > max_fields:
+        hidden = sum(len(chunk) for chunk in chunks[max_fields:])
+        chunks = chunks[:max_fields]
+        last = chunks[-1]
+        while len("\n".join(last + [f"...and {hidden} more"])) > EMBED_FIELD_LIMIT:
+            last.pop()
+            hidden += 1
+        last.append(f"...and {hidden} more")
 
-    # Remove the opposite reaction if user already reacted
-    channel = bot.get_channel(payload.channel_id)
-    message = await channel.fetch_message(payload.message_id)
-    user = await bot.fetch_user(payload.user_id)
+    for number, chunk in enumerate(chunks):
+        embed.add_field(name=name if number == 0 else f"{name} (cont.)", value="\n".join(chunk), inline=False)
 
-    opposite_emoji = TEAM2_EMOJI if prediction == "team1" else TEAM1_EMOJI
-    await message.remove_reaction(opposite_emoji, user)
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+@bot.tree.command(name="stats", description="[ADMIN] Show bot performance statistics")
+@is_admin()
+async def stats(interaction: discord.Interaction):
+    embed = discord.Embed(title="📈 Bot Statistics", color=discord.Color.blurple())
+
+    commands_lines = [
+        f"`/{dict(labels)['command']}` ({dict(labels)['status']}): {format_timings(histogram)}"
+        for labels, histogram in sorted(metrics.histograms("command_seconds").items())
+    ]
+    add_lines_field(embed, "Commands", commands_lines or ["No commands yet"], STATS_COMMAND_FIELDS)
+
+    reactions = metrics.histograms("reaction_handler_seconds").get(())
+    embed.add_field(name="Reactions", value=format_timings(reactions) if reactions else "No reactions yet", inline=False)
+
+    storage_lines = []
+    for name, label in (("storage_load_seconds", "Guild loads"), ("storage_flush_seconds", "Flushes")):
+        histogram = metrics.histograms(name).get(())
+        if histogram:
+            storage_lines.append(f"{label}: {format_timings(histogram)}")
+    hits = metrics.counter("guild_cache_total", result="hit")
+    misses = metrics.counter("guild_cache_total", result="miss")
+    if hits + misses:
+        storage_lines.append(f"Guild cache hits: {hits / (hits + misses) * 100:.1f}%")
+    storage_lines.append(f"Read {format_bytes(metrics.counter('storage_bytes_read_total'))}, "
+                         f"written {format_bytes(metrics.counter('storage_bytes_written_total'))}")
+    embed.add_field(name="Storage", value="\n".join(storage_lines), inline=False)
+
+    gauges = {name: value for (name, labels), value in metrics.gauge_values().items()}
+    embed.add_field(
+        name="Queues",
+        value=(f"Predictions waiting: {gauges.get('prediction_queue_depth', 0)}\n"
+               f"Storage calls in flight: {gauges.get('data_manager_calls_in_flight', 0)}\n"
+               f"Reaction removals waiting: {gauges.get('reaction_removal_queue_depth', 0)}"),
+        inline=False
+    )
+
+    rest_text = "\n".join(
+        f"{dict(labels)['call']}: {value:.0f}"
+        for labels, value in sorted(metrics.counters("discord_rest_calls_total").items())
+    )
+    embed.add_field(name="Discord REST calls", value=rest_text or "None yet", inline=False)
+
+    uptime = int(time.time() - metrics.started)
+    embed.set_footer(text=f"Uptime {uptime // 3600}h {uptime % 3600 // 60}m")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@bot.tree.command(name="sync_commands", description="[ADMIN] Push slash commands to Discord even if unchanged")
+@is_admin()
+async def sync_commands(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        synced = await sync_commands_with_discord(force=True)
+    except discord.HTTPException as e:
+        await interaction.followup.send(f"❌ Error: {e}", ephemeral=True)
+        return
+    await interaction.followup.send(f"✅ Synced {synced} command(s)", ephemeral=True)
 
 
 @bot.tree.command(name="help", description="Show help for commands")
@@ -347,9 +743,12 @@ async def help_command(interaction: discord.Interaction):
     `/create_tournament` - Create a tournament
     `/create_round` - Create a round (part of tournament or standalone)
     `/add_match` - Add a match to a round
+    `/add_matches` - Add several matches at once
     `/close_predictions` - Close predictions
     `/set_result` - Set match result
     `/leaderboard` - Show leaderboard
+    `/stats` - Show performance statistics
+    `/sync_commands` - Push slash commands to Discord
     """
 
     user_commands = """
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import discord
+
+from async_data_manager import AsyncDataManager
+from metrics import metrics
+
+
+class ReactionCatchUp:
+    """Records votes cast while the bot wasn't listening.
+
+    On (re)connect the match messages of every open round are read back:
+    their reactions are paged through with at most max_concurrency messages
+    at a time, compared with the stored predictions and the differences are
+    saved in one batch. Votes that arrive live while this runs win over what
+    was read, see note_vote().
+    """
+
+    def __init__(self, client: discord.Client, dm: AsyncDataManager, emojis: Dict[str, str], max_concurrency=8):
+        self.client = client
+        self.dm = dm
+        self.emojis = emojis  # emoji -> prediction
+        self.max_concurrency = max_concurrency
+        self._live_votes = None  # (match_id, user_id) voted on live during a run
+
+    @property
+    def running(self) -> bool:
+        return self._live_votes is not None
+
+    def note_vote(self, match_id: str, user_id: int):
+        """Tell a running catch-up that a user voted live, so it doesn't overwrite that vote"""
+        if self._live_votes is not None:
+            self._live_votes.add((match_id, user_id))
+
+    async def run(self, guild_ids: Iterable[int]) -> int:
+        """Catch up on all open rounds of the given guilds, returns the number of votes saved"""
+        if self.running:
+            return 0
+        self._live_votes = set()
+        start = time.perf_counter()
+        try:
+            matches = []
+            for guild_id in guild_ids:
+                matches.extend(await self.dm.get_open_matches(guild_id))
+
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            reactions = await asyncio.gather(*(self._read_votes(semaphore, match) for _, _, match in matches))
+
+            saved = await self._apply(
+                [(round_id, match, votes) for (round_id, _, match), votes in zip(matches, reactions) if votes]
+            )
+        finally:
+            self._live_votes = None
+
+        metrics.observe("catchup_seconds", time.perf_counter() - start)
+        metrics.inc("catchup_votes_total", saved)
+        print(f"Caught up on {len(matches)} match message(s), saved {saved} missed vote(s)")
+        return saved
+
+    async def _read_votes(self, semaphore: asyncio.Semaphore, match: Dict) -> Optional[Dict[int, Set[str]]]:
+        """Get {user_id: {emoji, ...}} for our emojis on a match message"""
+        if match["channel_id"] is None:
+            # Posted before channels were recorded, there's nothing to fetch it by
+            return None
+
+        async with semaphore:
+            channel = self.client.get_partial_messageable(match["channel_id"])
+            try:
+                metrics.inc("discord_rest_calls_total", call="fetch_message")
+                message = await channel.fetch_message(match["message_id"])
+
+                votes = {}
+                for reaction in message.reactions:
+                    emoji = str(reaction.emoji)
+                    if emoji not in self.emojis:
+                        continue
+                    # Pages of 100 users per request
+                    metrics.inc("discord_rest_calls_total", (reaction.count + 99) // 100, call="reaction_users")
+                    async for user in reaction.users(limit=None):
+                        if user.id != self.client.user.id:
+                            votes.setdefault(user.id, set()).add(emoji)
+                return votes
+            except (discord.NotFound, discord.Forbidden):
+                # Message deleted or not visible to us anymore
+                return None
+            except discord.HTTPException as e:
+                print(f"Failed to read reactions of match {match['id']}: {e}")
+                return None
+
+    async def _apply(self, reactions: List[Tuple[str, Dict, Dict[int, Set[str]]]]) -> int:
+        round_ids = sorted({round_id for round_id, _, _ in reactions})
+
+        # Rounds are locked in a fixed order, live handlers only ever hold one
+        async with AsyncExitStack() as stack:
+            for round_id in round_ids:
+                await stack.enter_async_context(self.dm.round_lock(round_id))
+
+            # A round may have closed while its messages were being read
+            stored = {}
+            for round_id in round_ids:
+                round_data = await self.dm.get_round(round_id)
+                if round_data and round_data["predictions_open"]:
+                    stored[round_id] = await self.dm.get_all_predictions(round_id)
+
+            records = []
+            for round_id, match, votes in reactions:
+                predictions = stored.get(round_id)
+                if predictions is None:
+                    continue
+                for user_id, emojis in votes.items():
+                    if (match["id"], user_id) in self._live_votes:
+                        continue
+                    current = predictions.get(str(user_id), {}).get(match["id"])
+
+                    if len(emojis) > 1:
+                        # Both reactions are left either by a vote while we were away or
+                        # by a removal that never ran, so there's no telling which is newer
+                        continue
+
+                    prediction = self.emojis[next(iter(emojis))]
+                    if prediction != current:
+                        records.append((round_id, match["id"], user_id, prediction))
+
+            if records:
+                await self.dm.save_predictions(records)
+        return len(records)
@@ -0,0 +1,608 @@
+"""Run the bot as several shard worker processes around one storage writer.
+
+    python cluster.py launch --workers 2 --shards 4   # writer plus bot.py workers
+    python cluster.py writer                          # just the writer
+    python cluster.py simulate --workers 3            # writer plus fake workers, no Discord
+
+Workers send every change to the writer over multiprocessing.connection and
+read from replicas of their guilds kept in memory, see ClusterDataManager.
+"""
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import random
+import secrets
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import AuthenticationError, Client, Connection, Listener
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+from archive import RoundArchive
+from async_data_manager import AsyncDataManager
+from data_manager import DataManager, guild_id_from_id
+from metrics import metrics
+from storage import Storage
+
+DEFAULT_ADDRESS = "127.0.0.1:6100"
+
+# DataManager calls that only the writer runs: changes, and IDs for new entities
+WRITER_CALLS = {
+    "next_tournament_id", "next_round_id", "create_tournament", "create_round",
+    "add_match", "add_matches", "set_match_message_id", "set_match_message_ids",
+    "close_predictions", "set_match_result", "save_prediction", "save_predictions", "archive_rounds",
+}
+# Writer calls that don't change anything
+ID_CALLS = {"next_tournament_id", "next_round_id"}
+# Changes replicas repeat on their copy. Anything else (creation timestamps,
+# archiving) can't be repeated exactly, so the guild is copied again instead
+REPLAYED_CALLS = {
+    "add_match", "add_matches", "set_match_message_id", "set_match_message_ids",
+    "close_predictions", "set_match_result", "save_prediction", "save_predictions",
+}
+# Repeated changes that can finish or reopen a round. Its finish time is the
+# writer's clock, so if it changes the guild is copied again after all
+FINISHING_CALLS = {"add_match", "add_matches", "close_predictions", "set_match_result"}
+
+# How often the writer evicts idle guilds and writes its metrics
+WRITER_HOUSEKEEPING_SECONDS = 60
+GUILD_IDLE_SECONDS = 30 * 60
+
+
+def parse_address(text: str) -> Union[Tuple[str, int], str]:
+    """Parse "host:port" for TCP, anything else is a Unix socket path"""
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return text
+
+
+def touched_guilds(method: str, args: Tuple) -> Set[int]:
+    """Get the guilds a writer call changes, archive_rounds excepted"""
+    if method == "save_predictions":
+        return {guild_id_from_id(record[0]) for record in args[0]}
+    if method in ("create_tournament", "create_round"):
+        return {args[2]}
+    return {guild_id_from_id(args[0])}
+
+
+class StorageWriter:
+    """The one process that changes stored data, on behalf of all shard workers.
+
+    Calls from workers run here one at a time, in arrival order. After each
+    change every worker with a replica of an affected guild is sent a change
+    notification, numbered in sequence, before the caller gets its result, so
+    a worker always reads its own writes.
+    """
+
+    def __init__(self, dm: DataManager, address, authkey: bytes):
+        self.dm = dm
+        self.listener = Listener(address, authkey=authkey)
+        self._inbox = queue.Queue()  # (connection, message), message is None once it closed
+        self._subscriptions = {}  # connection -> IDs of guilds it holds a replica of
+        self._seq = 0
+        self._running = False
+
+    @property
+    def address(self):
+        return self.listener.address
+
+    def serve_forever(self):
+        self._running = True
+        threading.Thread(target=self._accept, name="storage-writer-accept", daemon=True).start()
+        next_housekeeping = time.monotonic() + WRITER_HOUSEKEEPING_SECONDS
+        try:
+            while self._running:
+                try:
+                    connection, message = self._inbox.get(timeout=max(0.0, next_housekeeping - time.monotonic()))
+                except queue.Empty:
+                    self._housekeeping()
+                    next_housekeeping = time.monotonic() + WRITER_HOUSEKEEPING_SECONDS
+                    continue
+                if connection is not None:
+                    self._handle(connection, message)
+        finally:
+            self.listener.close()
+            self.dm.close()
+
+    def stop(self):
+        """Make serve_forever() return, safe to call from a signal handler or another thread"""
+        self._running = False
+        self._inbox.put((None, None))
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except AuthenticationError:
+                print("Rejected a storage client with the wrong key")
+                continue
+            except OSError:
+                return  # listener closed
+            threading.Thread(target=self._read, args=(connection,), name="storage-writer-read", daemon=True).start()
+
+    def _read(self, connection: Connection):
+        try:
+            while True:
+                self._inbox.put((connection, connection.recv()))
+        except (EOFError, OSError):
+            self._inbox.put((connection, None))
+
+    def _housekeeping(self):
+        self.dm.evict_idle_guilds(GUILD_IDLE_SECONDS)
+        try:
+            metrics.write_prometheus(os.path.join(self.dm.data_dir, "metrics-writer.prom"))
+        except OSError as e:
+            print(f"Failed to write metrics: {e}")
+
+    def _handle(self, connection: Connection, message: Optional[Tuple]):
+        if message is None:
+            self._subscriptions.pop(connection, None)
+            connection.close()
+            return
+
+        subscriptions = self._subscriptions.setdefault(connection, set())
+        kind = message[0]
+        if kind == "call":
+            _, call_id, method, args = message
+            self._call(connection, call_id, method, args)
+        elif kind == "snapshot":
+            _, call_id, guild_id = message
+            data, predictions = self.dm.export_guild(guild_id)
+            subscriptions.add(guild_id)
+            self._send(connection, ("result", call_id, (self._seq, data, predictions)))
+        elif kind == "unsubscribe":
+            subscriptions.discard(message[1])
+
+    def _call(self, connection: Connection, call_id: int, method: str, args: Tuple):
+        if method not in WRITER_CALLS:
+            self._send(connection, ("error", call_id, ValueError(f"{method} can't be called on the storage writer")))
+            return
+
+        archived_before = self._archived_counts() if method == "archive_rounds" else None
+        try:
+            with metrics.timer("storage_writer_call_seconds", call=method):
+                result = getattr(self.dm, method)(*args)
+        except Exception as e:
+            self._send(connection, ("error", call_id, e))
+            return
+
+        if method not in ID_CALLS:
+            if archived_before is not None:
+                guild_ids = {guild_id for guild_id, count in self._archived_counts().items()
+                             if count != archived_before.get(guild_id)}
+            else:
+                guild_ids = touched_guilds(method, args)
+            self._seq += 1
+            change = ("change", self._seq, guild_ids, method, args)
+            for other, subscribed in list(self._subscriptions.items()):
+                if subscribed & guild_ids:
+                    self._send(other, change)
+        self._send(connection, ("result", call_id, result))
+
+    def _archived_counts(self) -> Dict[int, int]:
+        return {
+            guild_id: len(self.dm.loaded_guild(guild_id).archived_rounds)
+            for guild_id in self.dm.loaded_guild_ids()
+        }
+
+    def _send(self, connection: Connection, message: Tuple):
+        try:
+            connection.send(message)
+        except (OSError, EOFError):
+            pass  # gone, its reader thread reports the close
+        except Exception as e:
+            # Exceptions that can't be pickled are sent as text
+            if message[0] != "error":
+                raise
+            connection.send(("error", message[1], RuntimeError(f"{type(message[2]).__name__}: {message[2]}")))
+
+
+class WriterClient:
+    """A worker's connection to the storage writer.
+
+    A background thread receives results and change notifications; results
+    complete the Future returned by call(), changes go to on_change in the
+    order the writer made them.
+    """
+
+    def __init__(self, address, authkey: bytes):
+        self._connection = Client(address, authkey=authkey)
+        self._send_lock = threading.Lock()
+        self._call_ids = itertools.count()
+        self._calls = {}  # call ID -> Future
+        self._closed = False
+        self.on_change: Optional[Callable] = None
+        threading.Thread(target=self._receive, name="storage-writer-client", daemon=True).start()
+
+    def _request(self, message_type: str, *payload) -> Future:
+        future = Future()
+        with self._send_lock:
+            if self._closed:
+                raise ConnectionError("Lost the connection to the storage writer")
+            call_id = next(self._call_ids)
+            self._calls[call_id] = future
+            self._connection.send((message_type, call_id) + payload)
+        return future
+
+    def call(self, method: str, args: Tuple) -> Future:
+        """Run a DataManager method on the writer"""
+        return self._request("call", method, args)
+
+    def snapshot(self, guild_id: int) -> Tuple[int, Dict, Dict]:
+        """Get (sequence number, data, predictions) of a guild and subscribe to its changes, blocks"""
+        return self._request("snapshot", guild_id).result()
+
+    def unsubscribe(self, guild_id: int):
+        with self._send_lock:
+            if not self._closed:
+                self._connection.send(("unsubscribe", guild_id))
+
+    def close(self):
+        with self._send_lock:
+            self._closed = True
+            self._connection.close()
+
+    def _receive(self):
+        try:
+            while True:
+                message = self._connection.recv()
+                if message[0] == "change":
+                    if self.on_change is not None:
+                        self.on_change(*message[1:])
+                    continue
+                future = self._calls.pop(message[1])
+                if message[0] == "result":
+                    future.set_result(message[2])
+                else:
+                    future.set_exception(message[2])
+        except (EOFError, OSError):
+            pass
+
+        with self._send_lock:
+            if not self._closed:
+                print("Lost the connection to the storage writer")
+            self._closed = True
+        for future in self._calls.values():
+            future.set_exception(ConnectionError("Lost the connection to the storage writer"))
+        self._calls = {}
+
+
+class ReplicaStorage(Storage):
+    """Storage of a replica: guilds are copied from the writer, changes are never persisted here"""
+
+    def __init__(self, client: WriterClient):
+        self.client = client
+        # Guild ID -> sequence number of the last change included in its copy
+        self.snapshot_seq = {}
+
+    def load_guild(self, guild_id: int) -> Tuple[Dict, Dict]:
+        seq, data, predictions = self.client.snapshot(guild_id)
+        self.snapshot_seq[guild_id] = seq
+        return data, predictions
+
+    def unload_guild(self, guild_id: int):
+        self.snapshot_seq.pop(guild_id, None)
+        self.client.unsubscribe(guild_id)
+
+    def guild_ids(self) -> List[int]:
+        return []
+
+    def finished_rounds(self, before: str) -> List[Tuple[int, str]]:
+        return []
+
+    def save_tournament(self, tournament: Dict):
+        pass
+
+    def save_round(self, round_data: Dict):
+        pass
+
+    def save_match(self, guild_id: int, round_id: str, match_index: int, match: Dict):
+        pass
+
+    def save_prediction(self, guild_id: int, round_id: str, match_id: str, user_id: int, prediction: str):
+        pass
+
+    def delete_round(self, guild_id: int, round_id: str):
+        pass
+
+    def flush(self):
+        pass
+
+
+class ReadOnlyArchive(RoundArchive):
+    """The writer's archive as seen by a replica on the same machine"""
+
+    def write(self, guild_id: int, round_id: str, payload: Dict, info: Dict):
+        pass
+
+    def delete(self, guild_id: int, round_id: str):
+        pass
+
+
+class ReplicaDataManager(DataManager):
+    """DataManager over copies of guilds, kept current by the writer's change notifications"""
+
+    def __init__(self, client: WriterClient, data_dir="data"):
+        super().__init__(data_dir, storage=ReplicaStorage(client))
+        self.archive = ReadOnlyArchive(self.archive.directory)
+
+    def apply_change(self, seq: int, guild_ids: Set[int], method: str, args: Tuple):
+        """Repeat a change made on the writer, or drop the guilds it touched so they're copied again"""
+        current = {
+            guild_id for guild_id in guild_ids
+            if guild_id in self._guilds and seq > self.storage.snapshot_seq.get(guild_id, 0)
+        }
+        if not current:
+            return
+
+        if method in REPLAYED_CALLS:
+            if method == "save_predictions":
+                args = ([record for record in args[0] if guild_id_from_id(record[0]) in current],)
+            round_id = args[0] if method in FINISHING_CALLS else None
+            finished_at = self._finished_at(round_id)
+            try:
+                getattr(self, method)(*args)
+                if self._finished_at(round_id) == finished_at:
+                    metrics.inc("replica_changes_total", result="repeated")
+                    return
+            except Exception as e:
+                print(f"Failed to repeat {method} on a replica, copying the guild again: {e}")
+
+        metrics.inc("replica_changes_total", result="copied")
+        for guild_id in current:
+            self.storage.unload_guild(guild_id)
+            del self._guilds[guild_id]
+
+    def _finished_at(self, round_id: Optional[str]) -> Optional[str]:
+        guild = self._guilds.get(guild_id_from_id(round_id)) if round_id else None
+        round_data = guild.rounds.get(round_id) if guild else None
+        return round_data.finished_at if round_data else None
+
+
+class ClusterDataManager(AsyncDataManager):
+    """AsyncDataManager of a shard worker process.
+
+    Calls in WRITER_CALLS go to the storage writer, everything else reads the
+    local replica. Discord routes all events of a guild to one shard, so the
+    round and guild locks still serialize everything that happens to a guild.
+    """
+
+    def __init__(self, client: WriterClient, data_dir="data", **kwargs):
+        super().__init__(ReplicaDataManager(client, data_dir), **kwargs)
+        self.client = client
+        client.on_change = self._on_change
+
+    def _on_change(self, seq: int, guild_ids: Set[int], method: str, args: Tuple):
+        # Called on the client's thread, the replica is only touched from the worker thread
+        try:
+            self._executor.submit(self.dm.apply_change, seq, guild_ids, method, args)
+        except RuntimeError:
+            pass  # shut down
+
+    async def _run(self, func, *args):
+        if func.__name__ not in WRITER_CALLS or getattr(func, "__self__", None) is not self.dm:
+            return await super()._run(func, *args)
+        self._in_flight += 1
+        try:
+            with metrics.timer("data_manager_call_seconds", call=func.__name__):
+                return await asyncio.wrap_future(self.client.call(func.__name__, args))
+        finally:
+            self._in_flight -= 1
+
+    async def close(self):
+        await super().close()
+        self.client.close()
+
+
+def connect(address: str, authkey: str, data_dir="data") -> ClusterDataManager:
+    """Connect a worker to the storage writer at "host:port" or a socket path"""
+    return ClusterDataManager(WriterClient(parse_address(address), authkey.encode()), data_dir)
+
+
+# Commands
+def run_writer(address: str, authkey: str, data_dir="data"):
+    writer = StorageWriter(DataManager(data_dir), parse_address(address), authkey.encode())
+    # Stop like on Ctrl+C, serve_forever() then flushes and closes storage
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Storage writer listening on {address}")
+    try:
+        writer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def wait_for_writer(address: str, authkey: str, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            Client(parse_address(address), authkey=authkey.encode()).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def launch(args) -> int:
+    """Start the writer and the bot workers, stop everything once one of them exits"""
+    authkey = os.getenv("STORAGE_WRITER_KEY") or secrets.token_hex(16)
+    env = dict(os.environ, STORAGE_WRITER_ADDRESS=args.address, STORAGE_WRITER_KEY=authkey)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    processes = [subprocess.Popen([sys.executable, os.path.join(here, "cluster.py"), "writer"], env=env)]
+    interrupted = False
+    try:
+        wait_for_writer(args.address, authkey)
+        for worker in range(args.workers):
+            shard_ids = range(worker, args.shards, args.workers)
+            worker_env = dict(env, SHARD_COUNT=str(args.shards),
+                              SHARD_IDS=",".join(map(str, shard_ids)), WORKER_ID=str(worker))
+            processes.append(subprocess.Popen([sys.executable, os.path.join(here, "bot.py")], env=worker_env))
+
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        # Ctrl+C reached the whole process group already
+        interrupted = True
+    finally:
+        # Workers first, so their queued votes reach the writer. SIGINT makes
+        # bot.py close cleanly, SIGTERM would kill it without flushing
+        for process in processes[1:] + processes[:1]:
+            if process.poll() is None and not interrupted:
+                process.send_signal(signal.SIGINT)
+            process.wait()
+    return max(process.returncode or 0 for process in processes)
+
+
+async def simulate_worker(args, worker: int, address: str, authkey: str, data_dir: str, barrier) -> Dict:
+    """A fake shard worker: votes in its own guilds and watches a neighbour's"""
+    rng = random.Random(args.seed + worker)
+    dm = connect(address, authkey, data_dir)
+    # Guilds are spread over workers the way Discord spreads them over shards
+    guild_ids = [1000 + n for n in range(args.guilds * args.workers) if n % args.workers == worker]
+    peer_guild_id = 1000 + (guild_ids[0] - 1000 + 1) % (args.guilds * args.workers)
+
+    rounds = {}
+    for guild_id in guild_ids:
+        tournament_id = await dm.next_tournament_id(guild_id)
+        await dm.create_tournament(tournament_id, f"Tournament {guild_id}", guild_id)
+        round_id = await dm.next_round_id(guild_id)
+        await dm.create_round(round_id, f"Round {guild_id}", guild_id, tournament_id)
+        matches = await dm.add_matches(round_id, [(f"Team {n}", f"Team {n + 1}") for n in range(args.matches)])
+        await dm.set_match_message_ids(round_id, {idx: guild_id * 1000 + idx for idx in range(len(matches))})
+        rounds[guild_id] = (round_id, [match["id"] for match in matches])
+        # Read like the reaction handler does, which copies the guild to our replica
+        await dm.get_round(round_id)
+    barrier.wait()
+
+    # Copy the neighbour's guild now, so its changes reach us as notifications
+    peer_round_id = (await dm.get_active_round(peer_guild_id))["id"]
+
+    expected = {}
+    start = time.perf_counter()
+    for n in range(args.votes):
+        guild_id = rng.choice(guild_ids)
+        round_id, match_ids = rounds[guild_id]
+        key = (round_id, rng.choice(match_ids), rng.randrange(args.users))
+        expected[key] = rng.choice(("team1", "team2"))
+        dm.submit_prediction(*key, expected[key])
+        if n % 100 == 0:
+            await asyncio.sleep(0)
+    await dm.flush_predictions()
+    elapsed = time.perf_counter() - start
+
+    for guild_id, (round_id, match_ids) in rounds.items():
+        await dm.close_predictions(round_id)
+        for idx in range(len(match_ids)):
+            await dm.set_match_result(round_id, idx, rng.choice(("team1", "team2")))
+    barrier.wait()
+    # Everyone is done writing; one round trip to the writer makes sure its notifications arrived
+    await dm.next_round_id(peer_guild_id)
+
+    lost = 0
+    for (round_id, match_id, user_id), prediction in expected.items():
+        if await dm.get_prediction(round_id, match_id, user_id) != prediction:
+            lost += 1
+
+    in_sync = True
+    for guild_id in guild_ids + [peer_guild_id]:
+        round_id = rounds[guild_id][0] if guild_id in rounds else peer_round_id
+        _, data, predictions = await asyncio.get_running_loop().run_in_executor(None, dm.client.snapshot, guild_id)
+        in_sync &= data["rounds"][round_id] == await dm.get_round(round_id)
+        in_sync &= predictions.get(round_id, {}) == await dm.get_all_predictions(round_id)
+        # Standings kept up to date by the repeated changes match a recount
+        in_sync &= _scores(await dm.get_round_leaderboard(round_id)) == \
+            _scores(await dm.calculate_round_leaderboard(round_id))
+
+    await dm.close()
+    return {"worker": worker, "votes": args.votes, "seconds": elapsed, "lost": lost, "in_sync": in_sync}
+
+
+def _scores(leaderboard: List[Dict]) -> List[Tuple[int, int, int]]:
+    return sorted((score["user_id"], score["correct"], score["total"]) for score in leaderboard)
+
+
+def _simulate_worker_process(args, worker: int, address: str, authkey: str, data_dir: str, barrier, results):
+    results.put(asyncio.run(simulate_worker(args, worker, address, authkey, data_dir, barrier)))
+
+
+def simulate(args) -> int:
+    """Run a writer and fake shard workers on this machine and check the replicas agree with it"""
+    data_dir = tempfile.mkdtemp(prefix="prediction-cluster-")
+    authkey = secrets.token_hex(16)
+    address = os.path.join(data_dir, "writer.sock") if hasattr(os, "fork") else DEFAULT_ADDRESS
+    try:
+        writer = multiprocessing.Process(target=run_writer, args=(address, authkey, data_dir))
+        writer.start()
+        wait_for_writer(address, authkey)
+
+        barrier = multiprocessing.Barrier(args.workers)
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=_simulate_worker_process,
+                                    args=(args, worker, address, authkey, data_dir, barrier, results))
+            for worker in range(args.workers)
+        ]
+        for process in workers:
+            process.start()
+        reports = sorted((results.get() for _ in workers), key=lambda report: report["worker"])
+        for process in workers:
+            process.join()
+        writer.terminate()
+        writer.join()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    ok = True
+    for report in reports:
+        print(f"worker {report['worker']}: {report['votes']} votes in {report['seconds']:.2f}s "
+              f"({report['votes'] / report['seconds']:.0f}/s), lost {report['lost']}, "
+              f"replicas {'in sync' if report['in_sync'] else 'OUT OF SYNC'}")
+        ok &= report["lost"] == 0 and report["in_sync"]
+    return 0 if ok else 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the bot as shard workers around one storage writer")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("writer", help="run the storage writer")
+
+    launch_parser = subparsers.add_parser("launch", help="run the writer and bot.py workers")
+    launch_parser.add_argument("--workers", type=int, default=2, help="worker processes")
+    launch_parser.add_argument("--shards", type=int, default=2, help="Discord shards, spread over the workers")
+    launch_parser.add_argument("--address", default=os.getenv("STORAGE_WRITER_ADDRESS", DEFAULT_ADDRESS))
+
+    simulate_parser = subparsers.add_parser("simulate", help="run the writer and fake workers without Discord")
+    simulate_parser.add_argument("--workers", type=int, default=3)
+    simulate_parser.add_argument("--guilds", type=int, default=2, help="guilds per worker")
+    simulate_parser.add_argument("--matches", type=int, default=8, help="matches per round")
+    simulate_parser.add_argument("--users", type=int, default=500)
+    simulate_parser.add_argument("--votes", type=int, default=10000, help="votes per worker")
+    simulate_parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "writer":
+        authkey = os.getenv("STORAGE_WRITER_KEY")
+        if not authkey:
+            print("Error: set STORAGE_WRITER_KEY, workers need the same key to connect")
+            return 1
+        run_writer(os.getenv("STORAGE_WRITER_ADDRESS", DEFAULT_ADDRESS), authkey)
+        return 0
+    if args.command == "launch":
+        return launch(args)
+    return simulate(args)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main())
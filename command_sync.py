@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+import discord
+from discord import app_commands
+
+
+class CommandSync:
+    """Syncs the command tree with Discord only when it changed.
+
+    A fingerprint of the registered commands is kept per scope (global or a
+    guild) in a small JSON file, so restarts and reconnects skip the slow,
+    globally rate-limited sync unless a command was added or edited.
+    """
+
+    def __init__(self, tree: app_commands.CommandTree, state_file: str):
+        self.tree = tree
+        self.state_file = state_file
+
+    def _command_payload(self, command) -> Dict:
+        try:
+            return command.to_dict(self.tree)
+        except TypeError:
+            # discord.py before 2.4 takes no tree argument
+            return command.to_dict()
+
+    def fingerprint(self, guild: Optional[discord.abc.Snowflake] = None) -> str:
+        """Hash of everything Discord would receive for this scope"""
+        payloads = sorted(
+            (self._command_payload(command) for command in self.tree.get_commands(guild=guild)),
+            key=lambda payload: (payload.get("type", 1), payload["name"])
+        )
+        data = json.dumps(payloads, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _scope(self, guild: Optional[discord.abc.Snowflake]) -> str:
+        # Separate bots sharing a data directory keep separate fingerprints
+        application_id = self.tree.client.application_id
+        return f"{application_id}:{guild.id if guild else 'global'}"
+
+    def _load_state(self) -> Dict[str, str]:
+        if not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    def _save_state(self, state: Dict[str, str]):
+        tmp_path = self.state_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    async def sync(self, guild: Optional[discord.abc.Snowflake] = None, force=False) -> Optional[int]:
+        """Sync if the commands changed since the last sync, returns how many were synced or None if skipped"""
+        fingerprint = self.fingerprint(guild)
+        state = self._load_state()
+        scope = self._scope(guild)
+        if not force and state.get(scope) == fingerprint:
+            return None
+
+        synced = await self.tree.sync(guild=guild)
+        state[scope] = fingerprint
+        self._save_state(state)
+        return len(synced)
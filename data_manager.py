@@ -1,39 +1,286 @@
-import json
 import os
-from datetime import datetime
-from typing import Dict, List, Optional
-
-class DataManager:
-    def __init__(self, data_dir="data"):
-        self.data_dir = data_dir
-        if not os.path.exists(data_dir):
-            os.makedirs(data_dir)
-
-        self.tournaments_file = os.path.join(data_dir, "tournaments.json")
-        self.predictions_file = os.path.join(data_dir, "predictions.json")
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import scoring
+from archive import RoundArchive
+from leaderboard import Standings
+from metrics import metrics
+from models import TEAM_CODES, Match, Round, RoundPredictions
+from search import PrefixIndex
+from storage import Storage, create_storage
+
+# Matches looked at per search before ranking, bounds the cost of a one letter query
+SEARCH_SCAN_LIMIT = 500
+
+
+def guild_id_from_id(entity_id: str) -> Optional[int]:
+    """Get the guild ID embedded in a tournament, round or match ID ("round_<guild_id>_<n>")"""
+    parts = entity_id.split("_") if entity_id else []
+    if len(parts) < 3 or not parts[1].isdigit():
+        return None
+    return int(parts[1])
+
+
+class GuildData:
+    """Everything stored for one guild, plus the indexes over it"""
+
+    def __init__(self, guild_id: int, data: Dict, predictions: Dict, archived: Dict[str, Dict], version: int):
+        self.guild_id = guild_id
+        self.tournaments = data["tournaments"]
+        self.rounds = {round_id: Round.from_dict(round_data) for round_id, round_data in data["rounds"].items()}
+        self.predictions = {
+            round_id: RoundPredictions.from_dict(round_predictions)
+            for round_id, round_predictions in predictions.items()
+        }
+        self.last_used = time.monotonic()
+
+        # Discord message ID -> (round_id, match_index)
+        self.message_index = {}
+        # Match ID -> (round_id, match_index)
+        self.match_index = {}
+        # Round IDs accepting predictions, in creation order
+        self.open_rounds = {}
+        # Round ID -> ID of the tournament it counts towards
+        self.round_tournament = {}
+        self.round_standings = {}
+        self.tournament_standings = {}
+        # Round or tournament ID -> version of its leaderboard, see DataManager.leaderboard_version()
+        self.base_version = version
+        self.versions = {}
+
+        # Archived round ID -> {"name", "tournament_id", "archived_at"}. A round
+        # that is also still in live storage (archiving was interrupted) stays live
+        self.archived_rounds = {round_id: info for round_id, info in archived.items() if round_id not in self.rounds}
+        # Archived rounds read back into memory, see DataManager._round()
+        self.cold_rounds = set()
+        # Tournament ID -> archived rounds not yet counted in its standings
+        self.unfolded_rounds = {}
+
+        for round_id, info in self.archived_rounds.items():
+            tournament = self.tournaments.get(info["tournament_id"])
+            if tournament is None:
+                continue
+            # SQLite derives tournament rounds from the live rounds table
+            if round_id not in tournament["rounds"]:
+                tournament["rounds"].append(round_id)
+            self.unfolded_rounds.setdefault(info["tournament_id"], []).append(round_id)
+
+        for tournament_id, tournament in self.tournaments.items():
+            for round_id in tournament["rounds"]:
+                self.round_tournament[round_id] = tournament_id
+        for round_id, round_data in self.rounds.items():
+            if round_data.active and round_data.predictions_open:
+                self.open_rounds[round_id] = None
+            for idx, match in enumerate(round_data.matches):
+                self.match_index[match.id] = (round_id, idx)
+                if match.message_id is not None:
+                    self.message_index[match.message_id] = (round_id, idx)
+
+        # Lookup by name or ID for autocomplete, archived rounds count as oldest
+        self.tournament_search = PrefixIndex()
+        for tournament_id, tournament in self.tournaments.items():
+            self.tournament_search.add(tournament_id, tournament["name"])
+        self.round_search = PrefixIndex()
+        for round_id, info in self.archived_rounds.items():
+            self.round_search.add(round_id, info["name"])
+        for round_id, round_data in self.rounds.items():
+            self.round_search.add(round_id, round_data.name)
 
-        self._init_files()
 
-    def _init_files(self):
-        """Initialize data files if they don't exist"""
-        if not os.path.exists(self.tournaments_file):
-            self._save_json(self.tournaments_file, {"tournaments": {}, "rounds": {}})
-        if not os.path.exists(self.predictions_file):
-            self._save_json(self.predictions_file, {})
+class DataManager:
+    """Tournaments, rounds and predictions, partitioned by guild.
 
-    def _load_json(self, filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    A guild's data is loaded from storage on first access and kept in memory
+    until evict_idle_guilds() drops it, so the cost of an operation depends
+    only on the size of that guild. Finished rounds are moved out of storage
+    by archive_rounds() and only read back when they are asked for.
+    """
 
-    def _save_json(self, filepath, data):
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def __init__(self, data_dir="data", autoflush=True, storage: Optional[Storage] = None):
+        self.data_dir = data_dir
+        # Backend is picked with STORAGE_BACKEND in .env unless one is passed in
+        self.storage = storage or create_storage(os.getenv("STORAGE_BACKEND", "json"), data_dir)
+        self.archive = RoundArchive(os.path.join(data_dir, "archive"))
+
+        # When autoflush is on every mutation is written through immediately,
+        # otherwise changes stay in memory until flush() is called
+        self.autoflush = autoflush
+
+        self._guilds = {}
+        # Last leaderboard version handed out, never reused, also across guild reloads
+        self._version = 0
+
+    # In-memory state
+    def reload(self):
+        """Drop in-memory state, guilds are reloaded from storage on next access.
+
+        Unloading a guild flushes it first, so with autoflush=False changes not
+        flushed yet are written out rather than discarded.
+        """
+        for guild_id in list(self._guilds):
+            self.storage.unload_guild(guild_id)
+        self._guilds = {}
+
+    def loaded_guild(self, guild_id: int) -> Optional[GuildData]:
+        """Get a guild's data if it is in memory, without loading it"""
+        return self._guilds.get(guild_id)
+
+    def loaded_guild_ids(self) -> List[int]:
+        """Get the IDs of guilds in memory"""
+        return list(self._guilds)
+
+    def evict_idle_guilds(self, max_idle: float) -> int:
+        """Drop guilds not accessed for max_idle seconds from memory, returns how many"""
+        cutoff = time.monotonic() - max_idle
+        idle = [guild_id for guild_id, guild in self._guilds.items() if guild.last_used < cutoff]
+        for guild_id in idle:
+            self.storage.unload_guild(guild_id)
+            del self._guilds[guild_id]
+        return len(idle)
+
+    def _guild(self, guild_id: int) -> GuildData:
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            metrics.inc("guild_cache_total", result="miss")
+            with metrics.timer("storage_load_seconds"):
+                guild = self._load_guild(guild_id)
+        else:
+            metrics.inc("guild_cache_total", result="hit")
+        guild.last_used = time.monotonic()
+        return guild
+
+    def _guild_for(self, entity_id: str) -> Optional[GuildData]:
+        """Get the guild owning a tournament, round or match ID"""
+        guild_id = guild_id_from_id(entity_id)
+        return self._guild(guild_id) if guild_id is not None else None
+
+    def _load_guild(self, guild_id: int) -> GuildData:
+        data, predictions = self.storage.load_guild(guild_id)
+        guild = self._guilds[guild_id] = GuildData(
+            guild_id, data, predictions, self.archive.index(guild_id), self._next_version()
+        )
+
+        # Compute round and tournament scores from scratch, archived rounds
+        # are added to their tournament once it is asked for
+        for round_id in guild.rounds:
+            standings = guild.round_standings[round_id] = Standings()
+            for score in self._score_round(guild, round_id):
+                standings.add(score["user_id"], score["correct"], score["total"])
+        for tournament_id, tournament in guild.tournaments.items():
+            standings = guild.tournament_standings[tournament_id] = Standings()
+            for round_id in tournament["rounds"]:
+                if round_id in guild.round_standings:
+                    self._add_standings(standings, guild.round_standings[round_id])
+        return guild
+
+    def _add_standings(self, standings: Standings, other: Standings):
+        for score in other.leaderboard():
+            standings.add(score["user_id"], score["correct"], score["total"])
+
+    def _round(self, guild: GuildData, round_id: str, write=False) -> Optional[Round]:
+        """Get a round, reading it back from the archive if needed.
+
+        With write, an archived round is moved back to live storage first.
+        """
+        if round_id in guild.archived_rounds:
+            if round_id not in guild.cold_rounds:
+                self._load_archived_round(guild, round_id)
+            if write:
+                self._restore_round(guild, round_id)
+        return guild.rounds.get(round_id)
+
+    def _add_score(self, guild: GuildData, round_id: str, user_id: int, correct: int, total: int):
+        """Apply a score change to a round and the tournament it belongs to"""
+        guild.round_standings[round_id].add(user_id, correct, total)
+
+        tournament_id = guild.round_tournament.get(round_id)
+        if tournament_id:
+            guild.tournament_standings[tournament_id].add(user_id, correct, total)
+        self._touch_leaderboard(guild, round_id)
+
+    def _next_version(self) -> int:
+        self._version += 1
+        return self._version
+
+    def _touch_leaderboard(self, guild: GuildData, round_id: str):
+        """Give a round's leaderboard and its tournament's a new version"""
+        version = self._next_version()
+        guild.versions[round_id] = version
+        tournament_id = guild.round_tournament.get(round_id)
+        if tournament_id:
+            guild.versions[tournament_id] = version
+
+    def leaderboard_version(self, entity_id: str) -> Optional[int]:
+        """Get a number that changes whenever a round's or tournament's leaderboard may have, None if it doesn't exist.
+
+        Rendered leaderboards are cached under it, see LeaderboardCache.
+        """
+        guild = self._guild_for(entity_id)
+        if guild is None:
+            return None
+        if entity_id not in guild.rounds and entity_id not in guild.archived_rounds \
+                and entity_id not in guild.tournaments:
+            return None
+        return guild.versions.get(entity_id, guild.base_version)
+
+    def _commit(self):
+        if self.autoflush:
+            self.flush()
+
+    def flush(self):
+        """Write all pending changes to storage"""
+        with metrics.timer("storage_flush_seconds"):
+            self.storage.flush()
+
+    def close(self):
+        """Flush pending changes and release the storage backend"""
+        self.storage.close()
+        self._guilds = {}
+
+    def next_tournament_id(self, guild_id: int) -> str:
+        """Generate an ID for a new tournament"""
+        tournaments = self._guild(guild_id).tournaments
+        n = len(tournaments)
+        while f"tournament_{guild_id}_{n}" in tournaments:
+            n += 1
+        return f"tournament_{guild_id}_{n}"
+
+    def next_round_id(self, guild_id: int) -> str:
+        """Generate an ID for a new round"""
+        guild = self._guild(guild_id)
+        n = len(guild.rounds)
+        while f"round_{guild_id}_{n}" in guild.rounds or f"round_{guild_id}_{n}" in guild.archived_rounds:
+            n += 1
+        return f"round_{guild_id}_{n}"
+
+    def _check_id(self, entity_id: str, guild_id: int):
+        if guild_id_from_id(entity_id) != guild_id:
+            raise ValueError(f"ID {entity_id} doesn't belong to guild {guild_id}")
+
+    def export_guild(self, guild_id: int) -> Tuple[Dict, Dict]:
+        """Get a guild's live data in the format of Storage.load_guild(), for replicas in other processes"""
+        guild = self._guild(guild_id)
+        rounds = {
+            round_id: round_data.to_dict()
+            for round_id, round_data in guild.rounds.items()
+            if round_id not in guild.cold_rounds
+        }
+        predictions = {
+            round_id: round_predictions.to_dict()
+            for round_id, round_predictions in guild.predictions.items()
+            if round_id in rounds
+        }
+        # Tournaments are shared with the live state, the result is meant to be pickled right away
+        return {"tournaments": guild.tournaments, "rounds": rounds}, predictions
 
     # Tournament management
     def create_tournament(self, tournament_id: str, name: str, guild_id: int) -> Dict:
         """Create a new tournament"""
-        data = self._load_json(self.tournaments_file)
-        data["tournaments"][tournament_id] = {
+        self._check_id(tournament_id, guild_id)
+        guild = self._guild(guild_id)
+        guild.tournaments[tournament_id] = {
             "id": tournament_id,
             "name": name,
             "guild_id": guild_id,
@@ -41,153 +288,374 @@ class DataManager:
             "rounds": [],
             "active": True
         }
-        self._save_json(self.tournaments_file, data)
-        return data["tournaments"][tournament_id]
+        guild.tournament_standings[tournament_id] = Standings()
+        guild.tournament_search.add(tournament_id, name)
+        self.storage.save_tournament(guild.tournaments[tournament_id])
+        self._commit()
+        return guild.tournaments[tournament_id]
 
     def create_round(self, round_id: str, name: str, guild_id: int, tournament_id: Optional[str] = None) -> Dict:
         """Create a new round (can be part of tournament or standalone)"""
-        data = self._load_json(self.tournaments_file)
-        data["rounds"][round_id] = {
-            "id": round_id,
-            "name": name,
-            "guild_id": guild_id,
-            "tournament_id": tournament_id,
-            "created_at": datetime.now().isoformat(),
-            "matches": [],
-            "active": True,
-            "predictions_open": True
-        }
-
-        if tournament_id and tournament_id in data["tournaments"]:
-            data["tournaments"][tournament_id]["rounds"].append(round_id)
-
-        self._save_json(self.tournaments_file, data)
-        return data["rounds"][round_id]
+        self._check_id(round_id, guild_id)
+        guild = self._guild(guild_id)
+        round_data = guild.rounds[round_id] = Round(round_id, name, guild_id, tournament_id, datetime.now().isoformat())
+
+        # Indexed before it is listed as open, autocomplete reads both from another thread
+        guild.round_search.add(round_id, name)
+        guild.open_rounds[round_id] = None
+        guild.round_standings[round_id] = Standings()
+        self.storage.save_round(round_data.to_dict())
+        if tournament_id and tournament_id in guild.tournaments:
+            guild.tournaments[tournament_id]["rounds"].append(round_id)
+            guild.round_tournament[round_id] = tournament_id
+            self.storage.save_tournament(guild.tournaments[tournament_id])
+
+        self._commit()
+        return round_data.to_dict()
 
     def add_match(self, round_id: str, team1: str, team2: str) -> Dict:
         """Add a match to a round"""
-        data = self._load_json(self.tournaments_file)
+        return self.add_matches(round_id, [(team1, team2)])[0]
 
-        if round_id not in data["rounds"]:
-            raise ValueError(f"Round {round_id} not found")
+    def add_matches(self, round_id: str, pairings: List[Tuple[str, str]]) -> List[Dict]:
+        """Add several (team1, team2) matches to a round in one commit"""
+        guild = self._guild_for(round_id)
+        round_data = self._round(guild, round_id, write=True) if guild else None
 
-        match_id = f"{round_id}_match_{len(data['rounds'][round_id]['matches'])}"
-        match = {
-            "id": match_id,
-            "team1": team1,
-            "team2": team2,
-            "result": None,  # None, "team1", "team2"
-            "message_id": None
-        }
-
-        data["rounds"][round_id]["matches"].append(match)
-        self._save_json(self.tournaments_file, data)
-        return match
+        if round_data is None:
+            raise ValueError(f"Round {round_id} not found")
 
-    def set_match_message_id(self, round_id: str, match_index: int, message_id: int):
-        """Set the Discord message ID for a match"""
-        data = self._load_json(self.tournaments_file)
-        data["rounds"][round_id]["matches"][match_index]["message_id"] = message_id
-        self._save_json(self.tournaments_file, data)
+        matches = []
+        for team1, team2 in pairings:
+            match = Match(f"{round_id}_match_{len(round_data.matches)}", team1, team2)
+            round_data.matches.append(match)
+            match_index = len(round_data.matches) - 1
+            guild.match_index[match.id] = (round_id, match_index)
+            self.storage.save_match(guild.guild_id, round_id, match_index, match.to_dict())
+            matches.append(match.to_dict())
+        if self._update_finished(round_data):
+            self.storage.save_round(round_data.to_dict())
+        self._commit()
+        return matches
+
+    def set_match_message_id(self, round_id: str, match_index: int, message_id: int,
+                             channel_id: Optional[int] = None):
+        """Set the Discord message ID for a match, and the channel it was posted in"""
+        self.set_match_message_ids(round_id, {match_index: message_id}, channel_id)
+
+    def set_match_message_ids(self, round_id: str, message_ids: Dict[int, int], channel_id: Optional[int] = None):
+        """Set the Discord message IDs of several matches, given as {match_index: message_id}, in one commit"""
+        guild = self._guild_for(round_id)
+        round_data = self._round(guild, round_id, write=True)
+        for match_index, message_id in message_ids.items():
+            match = round_data.matches[match_index]
+            if match.message_id is not None:
+                guild.message_index.pop(match.message_id, None)
+            match.message_id = message_id
+            match.channel_id = channel_id
+            if message_id is not None:
+                guild.message_index[message_id] = (round_id, match_index)
+            self.storage.save_match(guild.guild_id, round_id, match_index, match.to_dict())
+        self._commit()
 
     def close_predictions(self, round_id: str):
         """Close predictions for a round"""
-        data = self._load_json(self.tournaments_file)
-        if round_id in data["rounds"]:
-            data["rounds"][round_id]["predictions_open"] = False
-            self._save_json(self.tournaments_file, data)
+        guild = self._guild_for(round_id)
+        if guild and round_id in guild.archived_rounds:
+            # Archived rounds are closed already
+            return
+        if guild and round_id in guild.rounds:
+            guild.rounds[round_id].predictions_open = False
+            self._update_finished(guild.rounds[round_id])
+            guild.open_rounds.pop(round_id, None)
+            self._touch_leaderboard(guild, round_id)
+            self.storage.save_round(guild.rounds[round_id].to_dict())
+            self._commit()
 
     def set_match_result(self, round_id: str, match_index: int, winner: str):
         """Set the result of a match"""
-        data = self._load_json(self.tournaments_file)
-        data["rounds"][round_id]["matches"][match_index]["result"] = winner
-        self._save_json(self.tournaments_file, data)
+        guild = self._guild_for(round_id)
+        round_data = self._round(guild, round_id, write=True)
+        match = round_data.matches[match_index]
+        previous = match.result
+        match.result = winner
+        self._touch_leaderboard(guild, round_id)
+
+        # Only users who predicted this match are affected
+        predictions = guild.predictions.get(round_id)
+        if winner != previous and predictions:
+            for user_id, prediction in predictions.voters(match.id):
+                correct = (prediction == winner) - (bool(previous) and prediction == previous)
+                total = bool(winner) - bool(previous)
+                self._add_score(guild, round_id, user_id, correct, total)
+
+        self.storage.save_match(guild.guild_id, round_id, match_index, match.to_dict())
+        if self._update_finished(round_data):
+            self.storage.save_round(round_data.to_dict())
+        self._commit()
+
+    @staticmethod
+    def _update_finished(round_data: Round) -> bool:
+        """Stamp when a round got closed with every result in, or clear it, returns whether it changed"""
+        finished = not round_data.predictions_open and all(match.result for match in round_data.matches)
+        if finished == (round_data.finished_at is not None):
+            return False
+        round_data.finished_at = datetime.now().isoformat() if finished else None
+        return True
 
     def get_round(self, round_id: str) -> Optional[Dict]:
         """Get round data"""
-        data = self._load_json(self.tournaments_file)
-        return data["rounds"].get(round_id)
+        guild = self._guild_for(round_id)
+        round_data = self._round(guild, round_id) if guild else None
+        return round_data.to_dict() if round_data else None
 
     def get_tournament(self, tournament_id: str) -> Optional[Dict]:
         """Get tournament data"""
-        data = self._load_json(self.tournaments_file)
-        return data["tournaments"].get(tournament_id)
+        guild = self._guild_for(tournament_id)
+        return guild.tournaments.get(tournament_id) if guild else None
+
+    def find_match_by_message(self, guild_id: int, message_id: int) -> Optional[Tuple[str, int]]:
+        """Get (round_id, match_index) for a match message, or None if it isn't one"""
+        return self._guild(guild_id).message_index.get(message_id)
+
+    def get_open_matches(self, guild_id: int) -> List[Tuple[str, int, Dict]]:
+        """Get (round_id, match_index, match) for every posted match of a guild's open rounds"""
+        guild = self._guild(guild_id)
+        return [
+            (round_id, match_index, match.to_dict())
+            for round_id in guild.open_rounds
+            for match_index, match in enumerate(guild.rounds[round_id].matches)
+            if match.message_id is not None
+        ]
 
     def get_all_rounds(self, guild_id: int) -> List[Dict]:
-        """Get all rounds for a guild"""
-        data = self._load_json(self.tournaments_file)
-        return [r for r in data["rounds"].values() if r["guild_id"] == guild_id]
+        """Get all rounds for a guild, except archived ones that weren't read back"""
+        return [round_data.to_dict() for round_data in self._guild(guild_id).rounds.values()]
 
     def get_active_round(self, guild_id: int) -> Optional[Dict]:
         """Get the active round for a guild"""
-        rounds = self.get_all_rounds(guild_id)
-        active = [r for r in rounds if r["active"] and r["predictions_open"]]
-        return active[0] if active else None
+        guild = self._guild(guild_id)
+        round_id = next(iter(guild.open_rounds), None)
+        return guild.rounds[round_id].to_dict() if round_id else None
+
+    def search_rounds(self, guild_id: int, query: str, limit=25) -> List[Dict]:
+        """Find a guild's rounds by a prefix of their name or ID, open rounds first, then newest first.
+
+        Returns {"id", "name", "status"} with status "open", "closed" or "archived".
+        """
+        return self.rounds_matching(self._guild(guild_id), query, limit)
+
+    def search_tournaments(self, guild_id: int, query: str, limit=25) -> List[Dict]:
+        """Find a guild's tournaments by a prefix of their name or ID, active ones first, then newest first"""
+        return self.tournaments_matching(self._guild(guild_id), query, limit)
+
+    # Only read the guild, and copy dicts before iterating them, so these are
+    # safe to call from another thread while the guild is being changed
+    @staticmethod
+    def rounds_matching(guild: GuildData, query: str, limit=25) -> List[Dict]:
+        """search_rounds() on a loaded guild"""
+        index = guild.round_search
+        open_rounds = list(guild.open_rounds)
+        open_ids = [round_id for round_id in reversed(open_rounds) if index.matches(round_id, query)]
+        other_ids = [round_id for round_id in index.search(query, SEARCH_SCAN_LIMIT) if round_id not in guild.open_rounds]
+
+        results = []
+        for round_id in (open_ids + other_ids)[:limit]:
+            if round_id in guild.open_rounds:
+                status = "open"
+            elif round_id in guild.archived_rounds:
+                status = "archived"
+            else:
+                status = "closed"
+            results.append({"id": round_id, "name": index.name(round_id), "status": status})
+        return results
+
+    @staticmethod
+    def tournaments_matching(guild: GuildData, query: str, limit=25) -> List[Dict]:
+        """search_tournaments() on a loaded guild"""
+        found = guild.tournament_search.search(query, SEARCH_SCAN_LIMIT)
+        # sorted() is stable, so the newest first order holds within each group
+        found = sorted(found, key=lambda tournament_id: not guild.tournaments[tournament_id].get("active", True))
+        return [
+            {"id": tournament_id, "name": guild.tournaments[tournament_id]["name"]}
+            for tournament_id in found[:limit]
+        ]
 
     # Prediction management
+    def _set_prediction(self, guild: GuildData, round_id: str, match_id: str, user_id: int, prediction: str):
+        self._round(guild, round_id, write=True)
+        predictions = guild.predictions.get(round_id)
+        if predictions is None:
+            predictions = guild.predictions[round_id] = RoundPredictions()
+        previous = predictions.set(user_id, match_id, prediction)
+
+        # Changing a vote on an already resolved match moves the standings
+        location = guild.match_index.get(match_id)
+        if location and prediction != previous:
+            result = guild.rounds[location[0]].matches[location[1]].result
+            if result:
+                correct = (prediction == result) - (previous == result)
+                total = 0 if previous else 1
+                self._add_score(guild, round_id, user_id, correct, total)
+
     def save_prediction(self, round_id: str, match_id: str, user_id: int, prediction: str):
         """Save a user's prediction"""
-        data = self._load_json(self.predictions_file)
-
-        if round_id not in data:
-            data[round_id] = {}
-        if str(user_id) not in data[round_id]:
-            data[round_id][str(user_id)] = {}
-
-        data[round_id][str(user_id)][match_id] = prediction
-        self._save_json(self.predictions_file, data)
+        guild = self._guild_for(round_id)
+        self._set_prediction(guild, round_id, match_id, user_id, prediction)
+        self.storage.save_prediction(guild.guild_id, round_id, match_id, user_id, prediction)
+        self._commit()
+
+    def save_predictions(self, predictions: List[Tuple[str, str, int, str]]):
+        """Save a batch of (round_id, match_id, user_id, prediction) in one commit"""
+        for round_id, match_id, user_id, prediction in predictions:
+            guild = self._guild_for(round_id)
+            self._set_prediction(guild, round_id, match_id, user_id, prediction)
+            self.storage.save_prediction(guild.guild_id, round_id, match_id, user_id, prediction)
+        self._commit()
 
     def get_user_predictions(self, round_id: str, user_id: int) -> Dict:
         """Get all predictions for a user in a round"""
-        data = self._load_json(self.predictions_file)
-        return data.get(round_id, {}).get(str(user_id), {})
+        predictions = self._round_predictions(round_id)
+        return predictions.user_predictions(user_id) if predictions else {}
+
+    def get_prediction(self, round_id: str, match_id: str, user_id: int) -> Optional[str]:
+        """Get a user's prediction for one match"""
+        predictions = self._round_predictions(round_id)
+        return predictions.get(user_id, match_id) if predictions else None
 
     def get_all_predictions(self, round_id: str) -> Dict:
-        """Get all predictions for a round"""
-        data = self._load_json(self.predictions_file)
-        return data.get(round_id, {})
+        """Get all predictions for a round as {str(user_id): {match_id: prediction}}"""
+        predictions = self._round_predictions(round_id)
+        return predictions.to_dict() if predictions else {}
+
+    def _round_predictions(self, round_id: str) -> Optional[RoundPredictions]:
+        guild = self._guild_for(round_id)
+        if guild is None or self._round(guild, round_id) is None:
+            return None
+        return guild.predictions.get(round_id)
+
+    def _round_standings(self, round_id: str) -> Optional[Standings]:
+        guild = self._guild_for(round_id)
+        if guild is None or self._round(guild, round_id) is None:
+            return None
+        return guild.round_standings.get(round_id)
+
+    def _tournament_standings(self, tournament_id: str) -> Optional[Standings]:
+        guild = self._guild_for(tournament_id)
+        if guild is None or tournament_id not in guild.tournament_standings:
+            return None
+        self._fold_archived_rounds(guild, tournament_id)
+        return guild.tournament_standings[tournament_id]
+
+    def get_round_leaderboard(self, round_id: str) -> List[Dict]:
+        """Get the current standings of a round, best first"""
+        standings = self._round_standings(round_id)
+        return standings.leaderboard() if standings else []
+
+    def get_tournament_leaderboard(self, tournament_id: str) -> List[Dict]:
+        """Get the current overall standings of a tournament, best first"""
+        standings = self._tournament_standings(tournament_id)
+        return standings.leaderboard() if standings else []
+
+    def get_round_leaderboard_page(self, round_id: str, page: int, per_page: int = 10) -> Tuple[List[Dict], int]:
+        """Get one page (1-based) of a round's standings and the number of ranked users"""
+        return self._leaderboard_page(self._round_standings(round_id), page, per_page)
+
+    def get_tournament_leaderboard_page(self, tournament_id: str, page: int, per_page: int = 10) -> Tuple[List[Dict], int]:
+        """Get one page (1-based) of a tournament's standings and the number of ranked users"""
+        return self._leaderboard_page(self._tournament_standings(tournament_id), page, per_page)
+
+    def _leaderboard_page(self, standings: Optional[Standings], page: int, per_page: int) -> Tuple[List[Dict], int]:
+        if not standings:
+            return [], 0
+        return standings.page((page - 1) * per_page, per_page), len(standings)
+
+    def get_user_round_score(self, round_id: str, user_id: int) -> Optional[Dict]:
+        """Get a user's score and rank in a round, or None if they have no resolved predictions"""
+        standings = self._round_standings(round_id)
+        return standings.get(user_id) if standings else None
+
+    def _rank_scores(self, rows) -> List[Dict]:
+        """Build a sorted leaderboard from aggregated (user_id, correct, total) rows"""
+        scores = [
+            {
+                "user_id": int(user_id),
+                "correct": correct,
+                "total": total,
+                "percentage": round(correct / total * 100, 1) if total > 0 else 0
+            }
+            for user_id, correct, total in rows
+        ]
+        return sorted(scores, key=lambda x: (x["correct"], x["percentage"]), reverse=True)
 
     def calculate_round_leaderboard(self, round_id: str) -> List[Dict]:
         """Calculate leaderboard for a specific round"""
-        round_data = self.get_round(round_id)
-        if not round_data:
+        guild = self._guild_for(round_id)
+        if not guild or self._round(guild, round_id) is None:
             return []
+        return self._score_round(guild, round_id)
 
-        predictions = self.get_all_predictions(round_id)
-        scores = {}
-
-        for user_id, user_predictions in predictions.items():
-            correct = 0
-            total = 0
-
-            for match in round_data["matches"]:
-                match_id = match["id"]
-                if match["result"] and match_id in user_predictions:
-                    total += 1
-                    if user_predictions[match_id] == match["result"]:
-                        correct += 1
-
-            if total > 0:
-                scores[user_id] = {
-                    "user_id": int(user_id),
-                    "correct": correct,
-                    "total": total,
-                    "percentage": round(correct / total * 100, 1) if total > 0 else 0
-                }
-
-        leaderboard = sorted(scores.values(), key=lambda x: (x["correct"], x["percentage"]), reverse=True)
-        return leaderboard
+    def _score_round(self, guild: GuildData, round_id: str) -> List[Dict]:
+        round_data = guild.rounds[round_id]
+
+        # Archived rounds aren't in storage anymore
+        rows = None if round_id in guild.cold_rounds else self.storage.calculate_scores(guild.guild_id, [round_id])
+        if rows is not None:
+            return self._rank_scores(rows)
+
+        predictions = guild.predictions.get(round_id)
+        if not predictions:
+            return []
+        if scoring.available():
+            return scoring.rank(*scoring.count_round(round_data, predictions))
+
+        # Count per user position, one pass over each resolved match's column
+        correct = [0] * len(predictions)
+        total = [0] * len(predictions)
+        for match in round_data.matches:
+            column = predictions.column(match.id) if match.result else None
+            if column is None:
+                continue
+            result = TEAM_CODES[match.result]
+            for idx, code in enumerate(column):
+                if code:
+                    total[idx] += 1
+                    if code == result:
+                        correct[idx] += 1
+
+        return self._rank_scores(
+            (user_id, correct[idx], total[idx])
+            for idx, user_id in enumerate(predictions.user_ids)
+            if total[idx] > 0
+        )
 
     def calculate_tournament_leaderboard(self, tournament_id: str) -> List[Dict]:
         """Calculate overall leaderboard for a tournament"""
-        tournament = self.get_tournament(tournament_id)
+        guild = self._guild_for(tournament_id)
+        tournament = guild.tournaments.get(tournament_id) if guild else None
         if not tournament:
             return []
 
+        archived = [round_id for round_id in tournament["rounds"] if round_id in guild.archived_rounds]
+        for round_id in archived:
+            self._round(guild, round_id)
+
+        rows = self.storage.calculate_scores(guild.guild_id, tournament["rounds"]) if not archived else None
+        if rows is not None:
+            return self._rank_scores(rows)
+
+        if scoring.available():
+            parts = [
+                scoring.leaderboard_order(*scoring.count_round(guild.rounds[round_id], guild.predictions[round_id]))
+                for round_id in tournament["rounds"]
+                if guild.predictions.get(round_id)
+            ]
+            return scoring.rank(*scoring.combine(parts))
+
         user_totals = {}
 
         for round_id in tournament["rounds"]:
-            round_scores = self.calculate_round_leaderboard(round_id)
+            round_scores = self._score_round(guild, round_id)
             for score in round_scores:
                 user_id = str(score["user_id"])
                 if user_id not in user_totals:
@@ -203,3 +671,130 @@ class DataManager:
 
         leaderboard = sorted(user_totals.values(), key=lambda x: (x["correct"], x["percentage"]), reverse=True)
         return leaderboard
+
+    # Archive
+    def archive_rounds(self, max_age: float) -> int:
+        """Move rounds finished more than max_age seconds ago to the archive, returns how many.
+
+        A round is finished once predictions are closed and every match has a
+        result. Candidates are picked from round metadata in storage, so only
+        guilds with one are loaded; those that weren't in memory are dropped
+        again unless something was archived.
+        """
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+        candidates = {}
+        for guild_id, round_id in self.storage.finished_rounds(cutoff.isoformat()):
+            candidates.setdefault(guild_id, []).append(round_id)
+
+        archived = 0
+        for guild_id, round_ids in candidates.items():
+            loaded = guild_id in self._guilds
+            guild = self._guilds[guild_id] if loaded else self._load_guild(guild_id)
+            count = self._archive_guild_rounds(guild, round_ids, cutoff)
+            if not loaded and not count:
+                self.storage.unload_guild(guild_id)
+                del self._guilds[guild_id]
+            archived += count
+
+        if archived:
+            metrics.inc("rounds_archived_total", archived)
+        return archived
+
+    def _archive_guild_rounds(self, guild: GuildData, round_ids: List[str], cutoff: datetime) -> int:
+        archived = 0
+        stamped = False
+        for round_id in round_ids:
+            round_data = guild.rounds.get(round_id)
+            if round_data is None or round_id in guild.cold_rounds:
+                continue
+            if round_data.finished_at is None:
+                # Rounds finished before the time was recorded count from now
+                if self._update_finished(round_data):
+                    self.storage.save_round(round_data.to_dict())
+                    stamped = True
+                continue
+            if datetime.fromisoformat(round_data.finished_at) > cutoff:
+                continue
+            self._archive_round(guild, round_id)
+            archived += 1
+
+        if archived or stamped:
+            self._commit()
+        return archived
+
+    def _archive_round(self, guild: GuildData, round_id: str):
+        round_data = guild.rounds[round_id]
+        predictions = guild.predictions.get(round_id)
+        payload = {
+            "round": round_data.to_dict(),
+            "predictions": predictions.to_dict() if predictions else {},
+            "leaderboard": guild.round_standings[round_id].leaderboard()
+        }
+        info = {
+            "name": round_data.name,
+            "tournament_id": round_data.tournament_id,
+            "archived_at": datetime.now().isoformat()
+        }
+        # Written before the round leaves storage, so a crash never loses it
+        self.archive.write(guild.guild_id, round_id, payload, info)
+        self.storage.delete_round(guild.guild_id, round_id)
+
+        # The tournament's standings keep counting the round
+        self._forget_round(guild, round_id)
+        guild.archived_rounds[round_id] = info
+
+    def _forget_round(self, guild: GuildData, round_id: str):
+        """Drop a round and its indexes from memory"""
+        round_data = guild.rounds.pop(round_id)
+        for match in round_data.matches:
+            guild.match_index.pop(match.id, None)
+            if match.message_id is not None:
+                guild.message_index.pop(match.message_id, None)
+        guild.predictions.pop(round_id, None)
+        guild.round_standings.pop(round_id, None)
+        guild.open_rounds.pop(round_id, None)
+        guild.cold_rounds.discard(round_id)
+
+    def _load_archived_round(self, guild: GuildData, round_id: str):
+        """Read an archived round back into memory, without touching storage"""
+        metrics.inc("archive_reads_total")
+        payload = self.archive.read(guild.guild_id, round_id)
+        round_data = guild.rounds[round_id] = Round.from_dict(payload["round"])
+        guild.predictions[round_id] = RoundPredictions.from_dict(payload["predictions"])
+        standings = guild.round_standings[round_id] = Standings()
+        for score in payload["leaderboard"]:
+            standings.add(score["user_id"], score["correct"], score["total"])
+        for idx, match in enumerate(round_data.matches):
+            guild.match_index[match.id] = (round_id, idx)
+        guild.cold_rounds.add(round_id)
+
+    def _restore_round(self, guild: GuildData, round_id: str):
+        """Move a round that's read back from the archive to live storage, before it's changed"""
+        round_data = guild.rounds[round_id]
+        self.storage.save_round(round_data.to_dict())
+        for idx, match in enumerate(round_data.matches):
+            self.storage.save_match(guild.guild_id, round_id, idx, match.to_dict())
+            if match.message_id is not None:
+                guild.message_index[match.message_id] = (round_id, idx)
+        predictions = guild.predictions[round_id]
+        for user_id in predictions.user_ids:
+            for match_id, prediction in predictions.user_predictions(user_id).items():
+                self.storage.save_prediction(guild.guild_id, round_id, match_id, user_id, prediction)
+
+        # Live rounds always count in their tournament's standings
+        tournament_id = guild.round_tournament.get(round_id)
+        if round_id in guild.unfolded_rounds.get(tournament_id, []):
+            guild.unfolded_rounds[tournament_id].remove(round_id)
+            self._add_standings(guild.tournament_standings[tournament_id], guild.round_standings[round_id])
+
+        self.flush()
+        self.archive.delete(guild.guild_id, round_id)
+        guild.cold_rounds.discard(round_id)
+        del guild.archived_rounds[round_id]
+
+    def _fold_archived_rounds(self, guild: GuildData, tournament_id: str):
+        """Add archived rounds loaded with the guild to their tournament's standings"""
+        round_ids = guild.unfolded_rounds.pop(tournament_id, None)
+        for round_id in round_ids or []:
+            self._round(guild, round_id)
+            self._add_standings(guild.tournament_standings[tournament_id], guild.round_standings[round_id])
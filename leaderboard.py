@@ -0,0 +1,172 @@
+import random
+from typing import Dict, Iterator, List, Optional
+
+
+class RankedList:
+    """Sorted keys with positions, as an indexable skip list.
+
+    Inserting, removing, counting the keys below a key and seeking to a
+    position all take O(log n) expected time. Each node also stores how many
+    keys every one of its links skips, which is what makes positions cheap.
+    """
+
+    MAX_LEVELS = 24  # enough for millions of keys
+
+    class _Node:
+        __slots__ = ("key", "next", "width")
+
+        def __init__(self, key, height: int):
+            self.key = key
+            self.next = [None] * height
+            # Keys passed by following next[level], counting the target
+            self.width = [1] * height
+
+    def __init__(self):
+        self._head = self._Node(None, self.MAX_LEVELS)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _path(self, key):
+        """Get the last node before key on every level and its position (head is 0)"""
+        chain = [None] * self.MAX_LEVELS
+        positions = [0] * self.MAX_LEVELS
+        node, pos = self._head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and node.next[level].key < key:
+                pos += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+            positions[level] = pos
+        return chain, positions, pos
+
+    def bisect_left(self, key) -> int:
+        """Count the keys less than key"""
+        return self._path(key)[2]
+
+    def add(self, key):
+        chain, positions, pos = self._path(key)
+        height = 1
+        while height < self.MAX_LEVELS and random.random() < 0.5:
+            height += 1
+
+        node = self._Node(key, height)
+        for level in range(height):
+            prev = chain[level]
+            skipped = pos - positions[level]
+            node.next[level] = prev.next[level]
+            node.width[level] = prev.width[level] - skipped
+            prev.next[level] = node
+            prev.width[level] = skipped + 1
+        for level in range(height, self.MAX_LEVELS):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _, _ = self._path(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for level in range(len(node.next)):
+            prev = chain[level]
+            prev.width[level] += node.width[level] - 1
+            prev.next[level] = node.next[level]
+        for level in range(len(node.next), self.MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def slice(self, start: int, count: int) -> Iterator:
+        """Iterate over up to count keys starting at position start (0-based)"""
+        # Find the node at position start + 1, counting the head as 0
+        node, pos = self._head, 0
+        for level in reversed(range(self.MAX_LEVELS)):
+            while node.next[level] is not None and pos + node.width[level] <= start + 1:
+                pos += node.width[level]
+                node = node.next[level]
+        if pos != start + 1:
+            return
+        while node is not None and count > 0:
+            yield node.key
+            node = node.next[0]
+            count -= 1
+
+
+class Standings:
+    """Correct/total prediction counts per user, updated incrementally.
+
+    Users are also kept in a RankedList of (-correct, -percentage, user_id)
+    keys, so a score change, a rank lookup and a page all take logarithmic
+    time rather than a full sort.
+    """
+
+    def __init__(self):
+        self._scores = {}  # user_id -> [correct, total]
+        self._order = RankedList()
+
+    def __len__(self):
+        return len(self._order)
+
+    def add(self, user_id: int, correct: int, total: int):
+        """Apply a change in a user's correct and total counts"""
+        score = self._scores.get(user_id)
+        if score is None:
+            score = self._scores[user_id] = [0, 0]
+        else:
+            self._order.remove(self._key(user_id, *score))
+        score[0] += correct
+        score[1] += total
+
+        # Users without a single resolved prediction aren't ranked
+        if score[1] <= 0:
+            del self._scores[user_id]
+        else:
+            self._order.add(self._key(user_id, *score))
+
+    def get(self, user_id: int) -> Optional[Dict]:
+        """Get a user's score and rank, or None if they aren't ranked"""
+        score = self._scores.get(user_id)
+        if not score:
+            return None
+        return self._entry(self._key(user_id, *score))
+
+    def page(self, start: int, count: int) -> List[Dict]:
+        """Get count scores starting at position start (0-based), best first"""
+        entries = []
+        prev = None
+        for pos, key in enumerate(self._order.slice(start, count), start):
+            if prev is None:
+                rank = self._rank(key)
+            elif key[:2] != prev[:2]:
+                rank = pos + 1
+            entries.append(self._entry(key, rank))
+            prev = key
+        return entries
+
+    def leaderboard(self) -> List[Dict]:
+        """Get all scores, best first"""
+        return self.page(0, len(self._order))
+
+    def _rank(self, key) -> int:
+        # Users with equal correct and percentage share a rank
+        return self._order.bisect_left(key[:2]) + 1
+
+    def _entry(self, key, rank: Optional[int] = None) -> Dict:
+        user_id = key[2]
+        correct, total = self._scores[user_id]
+        return {
+            "user_id": user_id,
+            "correct": correct,
+            "total": total,
+            "percentage": self._percentage(correct, total),
+            "rank": rank if rank is not None else self._rank(key)
+        }
+
+    @staticmethod
+    def _percentage(correct: int, total: int) -> float:
+        return round(correct / total * 100, 1) if total > 0 else 0
+
+    @classmethod
+    def _key(cls, user_id: int, correct: int, total: int):
+        return (-correct, -cls._percentage(correct, total), user_id)
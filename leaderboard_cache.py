@@ -0,0 +1,58 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from metrics import metrics
+
+
+class LeaderboardCache:
+    """Rendered leaderboard pages, so a burst of identical /leaderboard calls costs one render.
+
+    Entries are stored with the leaderboard version they were rendered at
+    (see DataManager.leaderboard_version()) and only served while it is
+    current. Concurrent requests for the same page and version share one
+    in-flight render. Entries also expire after ttl seconds so renamed users
+    show up eventually, and the least recently used are dropped past max_size.
+    """
+
+    def __init__(self, max_size=512, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()  # key -> (version, value, expires_at)
+        self._in_flight = {}  # (key, version) -> asyncio.Task
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def get(self, key: Hashable, version: int, render: Callable[[], Awaitable[Any]]) -> Any:
+        """Get the cached value for key at version, or render it once for all callers"""
+        entry = self._cache.get(key)
+        if entry and entry[0] == version and entry[2] > time.monotonic():
+            self._cache.move_to_end(key)
+            metrics.inc("leaderboard_cache_total", result="hit")
+            return entry[1]
+
+        task = self._in_flight.get((key, version))
+        if task is not None:
+            metrics.inc("leaderboard_cache_total", result="shared")
+        else:
+            metrics.inc("leaderboard_cache_total", result="miss")
+            task = self._in_flight[(key, version)] = asyncio.ensure_future(render())
+            task.add_done_callback(lambda done: self._finish(key, version, done))
+        # A caller that gives up doesn't cancel the render for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, version: int, task: asyncio.Task):
+        del self._in_flight[(key, version)]
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        # Versions only grow, don't let a slow render replace a newer one
+        entry = self._cache.get(key)
+        if entry and entry[0] > version:
+            return
+        self._cache[key] = (version, task.result(), time.monotonic() + self.ttl)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
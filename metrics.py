@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+
+# Upper bounds in seconds, from sub-millisecond dict lookups to slow REST calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts of observations per bucket, plus their sum"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                lower = self.buckets[idx - 1] if idx > 0 else 0.0
+                if idx == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[idx] - lower) * (target - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """In-process counters, histograms and gauges, exported as Prometheus text.
+
+    Updated from both the event loop and the storage thread, so every change
+    goes through one lock. Labels are passed as keyword arguments.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._gauges = {}  # (name, labels) -> callable returning the current value
+
+    @staticmethod
+    def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the wall time spent in a with block, also across awaits"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name: str, func: Callable[[], float], **labels):
+        """Register a value that is read whenever metrics are exported"""
+        with self._lock:
+            self._gauges[self._key(name, labels)] = func
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def counters(self, name: str) -> Dict[Tuple, float]:
+        """Get {labels: value} of all series of a counter"""
+        with self._lock:
+            return {labels: value for (n, labels), value in self._counters.items() if n == name}
+
+    def histograms(self, name: str) -> Dict[Tuple, Histogram]:
+        with self._lock:
+            return {labels: histogram for (n, labels), histogram in self._histograms.items() if n == name}
+
+    def gauge_values(self) -> Dict[Tuple[str, Tuple], Optional[float]]:
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = {}
+        for key, func in gauges:
+            try:
+                values[key] = func()
+            except Exception:
+                values[key] = None
+        return values
+
+    def render_prometheus(self) -> str:
+        """Format everything in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, (histogram.buckets, list(histogram.counts), histogram.count, histogram.sum))
+                 for key, histogram in self._histograms.items()),
+                key=lambda item: item[0]
+            )
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), value in sorted(self.gauge_values().items()):
+            if value is None:
+                continue
+            declare(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filepath: str):
+        """Write the metrics file atomically, for node_exporter's textfile collector or similar"""
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, filepath)
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+# Shared by the bot and everything it uses
+metrics = Metrics()
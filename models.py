@@ -0,0 +1,161 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Predictions are stored as one byte per user and match
+NO_PREDICTION = 0
+TEAM_CODES = {"team1": 1, "team2": 2}
+CODE_TEAMS = (None, "team1", "team2")
+
+
+class Match:
+    __slots__ = ("id", "team1", "team2", "result", "message_id", "channel_id")
+
+    def __init__(self, id: str, team1: str, team2: str, result: Optional[str] = None,
+                 message_id: Optional[int] = None, channel_id: Optional[int] = None):
+        self.id = id
+        self.team1 = team1
+        self.team2 = team2
+        self.result = result  # None, "team1", "team2"
+        self.message_id = message_id
+        self.channel_id = channel_id  # Unknown for matches posted by older versions
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Match":
+        return cls(data["id"], data["team1"], data["team2"], data["result"], data["message_id"],
+                   data.get("channel_id"))
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "team1": self.team1,
+            "team2": self.team2,
+            "result": self.result,
+            "message_id": self.message_id,
+            "channel_id": self.channel_id
+        }
+
+
+class Round:
+    __slots__ = ("id", "name", "guild_id", "tournament_id", "created_at", "matches", "active", "predictions_open",
+                 "finished_at")
+
+    def __init__(self, id: str, name: str, guild_id: int, tournament_id: Optional[str], created_at: str,
+                 matches: Optional[List[Match]] = None, active=True, predictions_open=True,
+                 finished_at: Optional[str] = None):
+        self.id = id
+        self.name = name
+        self.guild_id = guild_id
+        self.tournament_id = tournament_id
+        self.created_at = created_at
+        self.matches = matches if matches is not None else []
+        self.active = active
+        self.predictions_open = predictions_open
+        # When predictions were closed with every result in, None until then
+        self.finished_at = finished_at
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Round":
+        return cls(
+            data["id"], data["name"], data["guild_id"], data["tournament_id"], data["created_at"],
+            [Match.from_dict(match) for match in data["matches"]], data["active"], data["predictions_open"],
+            data.get("finished_at")
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "guild_id": self.guild_id,
+            "tournament_id": self.tournament_id,
+            "created_at": self.created_at,
+            "matches": [match.to_dict() for match in self.matches],
+            "active": self.active,
+            "predictions_open": self.predictions_open,
+            "finished_at": self.finished_at
+        }
+
+
+class RoundPredictions:
+    """All predictions of one round, packed into one bytearray per match.
+
+    Users and matches are mapped to dense indices; column[user_index] holds
+    NO_PREDICTION or a TEAM_CODES value. The nested dict shape
+    {str(user_id): {match_id: "team1"/"team2"}} is only built on request.
+    """
+
+    __slots__ = ("user_ids", "user_index", "match_index", "columns")
+
+    def __init__(self):
+        self.user_ids = []
+        self.user_index = {}  # user_id -> position in user_ids and every column
+        self.match_index = {}  # match_id -> position in columns
+        self.columns = []
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RoundPredictions":
+        predictions = cls()
+        for user_id, user_predictions in data.items():
+            for match_id, prediction in user_predictions.items():
+                predictions.set(int(user_id), match_id, prediction)
+        return predictions
+
+    def to_dict(self) -> Dict:
+        result = {}
+        for user_id in self.user_ids:
+            user_predictions = self.user_predictions(user_id)
+            if user_predictions:
+                result[str(user_id)] = user_predictions
+        return result
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def column(self, match_id: str) -> Optional[bytearray]:
+        """Get the codes of all users for one match, indexed like user_ids"""
+        idx = self.match_index.get(match_id)
+        return self.columns[idx] if idx is not None else None
+
+    def get(self, user_id: int, match_id: str) -> Optional[str]:
+        user_idx = self.user_index.get(user_id)
+        match_idx = self.match_index.get(match_id)
+        if user_idx is None or match_idx is None:
+            return None
+        return CODE_TEAMS[self.columns[match_idx][user_idx]]
+
+    def set(self, user_id: int, match_id: str, prediction: str) -> Optional[str]:
+        """Store a prediction and return the one it replaced"""
+        user_idx = self.user_index.get(user_id)
+        if user_idx is None:
+            user_idx = self.user_index[user_id] = len(self.user_ids)
+            self.user_ids.append(user_id)
+            for column in self.columns:
+                column.append(NO_PREDICTION)
+
+        match_idx = self.match_index.get(match_id)
+        if match_idx is None:
+            match_idx = self.match_index[match_id] = len(self.columns)
+            self.columns.append(bytearray(len(self.user_ids)))
+
+        column = self.columns[match_idx]
+        previous = CODE_TEAMS[column[user_idx]]
+        column[user_idx] = TEAM_CODES[prediction]
+        return previous
+
+    def user_predictions(self, user_id: int) -> Dict[str, str]:
+        """Get {match_id: prediction} for one user"""
+        user_idx = self.user_index.get(user_id)
+        if user_idx is None:
+            return {}
+        return {
+            match_id: CODE_TEAMS[self.columns[match_idx][user_idx]]
+            for match_id, match_idx in self.match_index.items()
+            if self.columns[match_idx][user_idx]
+        }
+
+    def voters(self, match_id: str) -> Iterator[Tuple[int, str]]:
+        """Yield (user_id, prediction) for every user who predicted a match"""
+        column = self.column(match_id)
+        if column is None:
+            return
+        for user_idx, code in enumerate(column):
+            if code:
+                yield self.user_ids[user_idx], CODE_TEAMS[code]
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import discord
+
+from metrics import metrics
+
+
+class NameResolver:
+    """Resolves user IDs to display names for leaderboards.
+
+    Names come from the guild member cache or the client's user cache first.
+    Anything else is remembered in a bounded LRU cache with a TTL, and misses
+    are fetched over REST concurrently, at most max_concurrency at a time.
+    """
+
+    def __init__(self, client: discord.Client, max_size=10000, ttl=3600, max_concurrency=5):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_concurrency = max_concurrency
+        self._cache = OrderedDict()  # user_id -> (name, expires_at)
+        # Created on first use so it binds to the bot's running loop
+        self._semaphore = None
+
+    def _get_cached(self, user_id: int, guild: Optional[discord.Guild]) -> Optional[str]:
+        member = guild.get_member(user_id) if guild else None
+        if member:
+            metrics.inc("name_lookups_total", source="member")
+            return member.name
+
+        user = self.client.get_user(user_id)
+        if user:
+            metrics.inc("name_lookups_total", source="user")
+            return user.name
+
+        entry = self._cache.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            self._cache.move_to_end(user_id)
+            metrics.inc("name_lookups_total", source="cache")
+            return entry[0]
+        return None
+
+    def _remember(self, user_id: int, name: str):
+        self._cache[user_id] = (name, time.monotonic() + self.ttl)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, user_id: int) -> str:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            metrics.inc("name_lookups_total", source="rest")
+            metrics.inc("discord_rest_calls_total", call="fetch_user")
+            try:
+                user = await self.client.fetch_user(user_id)
+            except discord.HTTPException:
+                # Deleted accounts and transient errors shouldn't break the leaderboard
+                return f"User {user_id}"
+        self._remember(user_id, user.name)
+        return user.name
+
+    async def resolve(self, user_ids: Iterable[int], guild: Optional[discord.Guild] = None) -> Dict[int, str]:
+        """Get {user_id: name} for all given users"""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self._get_cached(user_id, guild)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+
+        if missing:
+            fetched = await asyncio.gather(*(self._fetch(user_id) for user_id in missing))
+            names.update(zip(missing, fetched))
+        return names
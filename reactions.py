@@ -0,0 +1,71 @@
+import asyncio
+
+import discord
+
+from metrics import metrics
+
+
+class ReactionRemovalQueue:
+    """Removes users' reactions in the background.
+
+    Removals are made on partial messages, so they cost exactly one REST call
+    each, and are paced to at most `rate` per second so a burst of votes
+    doesn't run into Discord's rate limits. Duplicate requests are dropped.
+    """
+
+    def __init__(self, client: discord.Client, rate=4.0, max_size=10000):
+        self.client = client
+        self.interval = 1 / rate
+        self.max_size = max_size
+        self._queue = None
+        self._queued = set()
+        self._worker = None
+        metrics.gauge("reaction_removal_queue_depth", self.qsize)
+
+    def remove(self, channel_id: int, message_id: int, emoji: str, user_id: int):
+        """Queue removal of a user's reaction without waiting for it"""
+        if self._queue is None:
+            # Created on first use so they bind to the bot's running loop
+            self._queue = asyncio.Queue(self.max_size)
+            self._worker = asyncio.ensure_future(self._run())
+
+        item = (channel_id, message_id, emoji, user_id)
+        if item in self._queued:
+            return
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            print(f"Reaction removal queue is full, dropping removal on message {message_id}")
+            return
+        self._queued.add(item)
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            self._queued.discard(item)
+            channel_id, message_id, emoji, user_id = item
+
+            message = self.client.get_partial_messageable(channel_id).get_partial_message(message_id)
+            metrics.inc("discord_rest_calls_total", call="remove_reaction")
+            try:
+                await message.remove_reaction(emoji, discord.Object(id=user_id))
+            except (discord.NotFound, discord.Forbidden):
+                # Message was deleted or we lost permissions, nothing to retry
+                pass
+            except discord.HTTPException as e:
+                print(f"Failed to remove reaction on message {message_id}: {e}")
+
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        """Stop the worker, pending removals are dropped"""
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
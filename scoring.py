@@ -0,0 +1,91 @@
+from typing import Dict, List, Tuple
+
+from models import TEAM_CODES, Round, RoundPredictions
+
+# NumPy is optional, DataManager scores in pure Python without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def available() -> bool:
+    return np is not None
+
+
+def count_round(round_data: Round, predictions: RoundPredictions) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Get (user_ids, correct, total) of users with resolved predictions, in user order"""
+    resolved = [
+        (predictions.column(match.id), TEAM_CODES[match.result])
+        for match in round_data.matches
+        if match.result and predictions.column(match.id) is not None
+    ]
+    if not resolved or not len(predictions):
+        return _empty(), _empty(), _empty()
+
+    # matches x users matrix of vote codes, joined into a copy so the
+    # bytearrays can still grow while it's in use
+    votes = np.frombuffer(b"".join(column for column, _ in resolved), dtype=np.uint8)
+    votes = votes.reshape(len(resolved), len(predictions))
+    results = np.array([result for _, result in resolved], dtype=np.uint8)
+
+    total = np.count_nonzero(votes, axis=0)
+    correct = np.count_nonzero(votes == results[:, None], axis=0)
+    ranked = total > 0
+    user_ids = np.array(predictions.user_ids, dtype=np.int64)
+    return user_ids[ranked], correct[ranked], total[ranked]
+
+
+def combine(parts: List[Tuple["np.ndarray", "np.ndarray", "np.ndarray"]]) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Sum (user_ids, correct, total) over several rounds, users in order of first appearance"""
+    if not parts:
+        return _empty(), _empty(), _empty()
+    user_ids = np.concatenate([part[0] for part in parts])
+    correct = np.concatenate([part[1] for part in parts])
+    total = np.concatenate([part[2] for part in parts])
+
+    unique_ids, first, inverse = np.unique(user_ids, return_index=True, return_inverse=True)
+    correct = np.bincount(inverse, weights=correct, minlength=len(unique_ids)).astype(np.int64)
+    total = np.bincount(inverse, weights=total, minlength=len(unique_ids)).astype(np.int64)
+
+    order = np.argsort(first, kind="stable")
+    return unique_ids[order], correct[order], total[order]
+
+
+def rank(user_ids: "np.ndarray", correct: "np.ndarray", total: "np.ndarray") -> List[Dict]:
+    """Build a leaderboard sorted exactly like DataManager's pure-Python scoring"""
+    if not len(user_ids):
+        return []
+    percentage = _percentages(correct, total)
+
+    # lexsort is stable, so ties keep their order like Python's sorted(reverse=True)
+    order = np.lexsort((-percentage, -correct))
+    return [
+        {"user_id": user_id, "correct": c, "total": t, "percentage": p}
+        for user_id, c, t, p in zip(
+            user_ids[order].tolist(), correct[order].tolist(), total[order].tolist(), percentage[order].tolist()
+        )
+    ]
+
+
+def leaderboard_order(user_ids: "np.ndarray", correct: "np.ndarray", total: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """Reorder (user_ids, correct, total) best first, without building dicts"""
+    if not len(user_ids):
+        return user_ids, correct, total
+    order = np.lexsort((-_percentages(correct, total), -correct))
+    return user_ids[order], correct[order], total[order]
+
+
+def _percentages(correct: "np.ndarray", total: "np.ndarray") -> "np.ndarray":
+    # Rounded with Python's round() so values and ties match exactly; there
+    # are far fewer distinct (correct, total) pairs than users
+    width = int(total.max()) + 1
+    unique_pairs, inverse = np.unique(correct.astype(np.int64) * width + total, return_inverse=True)
+    rounded = np.array(
+        [round(c / t * 100, 1) for c, t in zip((unique_pairs // width).tolist(), (unique_pairs % width).tolist())]
+    )
+    return rounded[inverse.reshape(-1)]
+
+
+def _empty() -> "np.ndarray":
+    return np.zeros(0, dtype=np.int64)
@@ -0,0 +1,61 @@
+from bisect import bisect_left, insort
+from typing import Iterator, List
+
+
+class PrefixIndex:
+    """Finds entities by a prefix of their ID, their name or any word of their name.
+
+    Terms are kept in one sorted list of (term, entity_id), so a lookup is a
+    binary search plus a scan over the matching terms. Entities are never
+    removed; the index is dropped along with its guild.
+    """
+
+    def __init__(self):
+        self._terms = []  # sorted (term, entity_id)
+        self._entities = {}  # entity_id -> (name, insertion number, terms)
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._entities
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def name(self, entity_id: str) -> str:
+        return self._entities[entity_id][0]
+
+    def _order(self, entity_id: str) -> int:
+        return self._entities[entity_id][1]
+
+    def add(self, entity_id: str, name: str):
+        if entity_id in self._entities:
+            return
+        folded = name.casefold()
+        terms = {entity_id.casefold(), folded}
+        terms.update(folded.split())
+        self._entities[entity_id] = (name, len(self._entities), tuple(terms))
+        for term in terms:
+            insort(self._terms, (term, entity_id))
+
+    def matches(self, entity_id: str, query: str) -> bool:
+        """Check whether one entity matches a query"""
+        prefix = query.casefold().strip()
+        return any(term.startswith(prefix) for term in self._entities[entity_id][2])
+
+    def search(self, query: str, limit: int) -> List[str]:
+        """Get the IDs of up to limit matching entities, newest first"""
+        prefix = query.casefold().strip()
+        if not prefix:
+            return list(reversed(self._entities))[:limit]
+
+        found = set()
+        for entity_id in self._scan(prefix):
+            found.add(entity_id)
+            if len(found) >= limit:
+                break
+        return sorted(found, key=self._order, reverse=True)
+
+    def _scan(self, prefix: str) -> Iterator[str]:
+        idx = bisect_left(self._terms, (prefix,))
+        while idx < len(self._terms) and self._terms[idx][0].startswith(prefix):
+            yield self._terms[idx][1]
+            idx += 1
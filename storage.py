@@ -0,0 +1,665 @@
+import copy
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+# Compact predictions.json once the journal grows past this many bytes
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+
+class Storage(ABC):
+    """Persistence backend for DataManager.
+
+    Data is partitioned by guild. DataManager loads a guild's data when it is
+    first needed, keeps it in memory and reports every change to the backend,
+    which decides how and when it reaches disk.
+    """
+
+    @abstractmethod
+    def load_guild(self, guild_id: int) -> Tuple[Dict, Dict]:
+        """Load ({"tournaments": ..., "rounds": ...}, predictions) of one guild"""
+
+    def unload_guild(self, guild_id: int):
+        """Flush a guild and release anything held for it"""
+        self.flush()
+
+    @abstractmethod
+    def guild_ids(self) -> List[int]:
+        """Get the IDs of all guilds with stored data"""
+
+    @abstractmethod
+    def finished_rounds(self, before: str) -> List[Tuple[int, str]]:
+        """Get (guild_id, round_id) of rounds finished at or before an ISO time, without loading guilds.
+
+        Finished rounds without a finish time are included too.
+        """
+
+    @abstractmethod
+    def save_tournament(self, tournament: Dict):
+        """Persist a created or modified tournament"""
+
+    @abstractmethod
+    def save_round(self, round_data: Dict):
+        """Persist a created or modified round (without its matches)"""
+
+    @abstractmethod
+    def save_match(self, guild_id: int, round_id: str, match_index: int, match: Dict):
+        """Persist a created or modified match"""
+
+    @abstractmethod
+    def save_prediction(self, guild_id: int, round_id: str, match_id: str, user_id: int, prediction: str):
+        """Persist a user's prediction"""
+
+    @abstractmethod
+    def delete_round(self, guild_id: int, round_id: str):
+        """Remove a round with its matches and predictions"""
+
+    @abstractmethod
+    def flush(self):
+        """Make all changes reported so far durable"""
+
+    def close(self):
+        """Flush and release files or connections"""
+        self.flush()
+
+    def calculate_scores(self, guild_id: int, round_ids: List[str]) -> Optional[List[Tuple[int, int, int]]]:
+        """Aggregate (user_id, correct, total) over resolved matches of the given rounds.
+
+        Returns None when the backend can't aggregate, DataManager then scores in memory.
+        """
+        return None
+
+
+def round_finished_before(round_data: Dict, before: str) -> bool:
+    """Check a stored round for Storage.finished_rounds()"""
+    if round_data["predictions_open"]:
+        return False
+    finished_at = round_data.get("finished_at")
+    if finished_at is None:
+        # Finished before finish times were recorded, DataManager stamps it
+        return all(match["result"] for match in round_data["matches"])
+    return finished_at <= before
+
+
+class JsonGuildFiles:
+    """tournaments.json plus a predictions.json snapshot with an append-only journal"""
+
+    def __init__(self, directory: str, journal_compact_bytes=JOURNAL_COMPACT_BYTES):
+        self.directory = directory
+        self.tournaments_file = os.path.join(directory, "tournaments.json")
+        self.predictions_file = os.path.join(directory, "predictions.json")
+        # Predictions are appended here and folded into predictions.json on compaction
+        self.journal_file = os.path.join(directory, "predictions.journal")
+        self.journal_compact_bytes = journal_compact_bytes
+
+        self._data = {"tournaments": {}, "rounds": {}}
+        self._dirty = False
+        self._journal = None
+        self._compaction = None
+
+    def _init_files(self):
+        """Initialize data files if they don't exist"""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if not os.path.exists(self.tournaments_file):
+            self._save_json(self.tournaments_file, {"tournaments": {}, "rounds": {}})
+        if not os.path.exists(self.predictions_file):
+            self._save_json(self.predictions_file, {})
+
+    def _load_json(self, filepath):
+        metrics.inc("storage_bytes_read_total", os.path.getsize(filepath))
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_json(self, filepath, data):
+        # Write to a temporary file first so a crash never leaves a truncated file
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        metrics.inc("storage_bytes_written_total", os.path.getsize(tmp_path))
+        os.replace(tmp_path, filepath)
+
+    def load(self) -> Tuple[Dict, Dict]:
+        self._close_journal()
+
+        # Tournaments and rounds are kept to rewrite tournaments.json on flush,
+        # predictions only live in the files and are handed over to DataManager
+        self._data = {"tournaments": {}, "rounds": {}}
+        self._dirty = False
+        if not os.path.exists(self.directory):
+            # Nothing stored yet, files are created on the first write
+            return copy.deepcopy(self._data), {}
+
+        self._data = self._load_json(self.tournaments_file)
+        predictions = self._load_json(self.predictions_file)
+
+        # A rotated journal is left behind only if a compaction didn't finish
+        rotated_file = self.journal_file + ".1"
+        self._replay_journal(rotated_file, predictions)
+        self._replay_journal(self.journal_file, predictions)
+        self._open_journal()
+        if os.path.exists(rotated_file):
+            self._start_compaction()
+            self._compaction.join()
+
+        return copy.deepcopy(self._data), predictions
+
+    def rounds(self) -> Dict:
+        """Rounds of a loaded guild, including changes not flushed yet"""
+        return self._data["rounds"]
+
+    def stored_rounds(self) -> Dict:
+        """Rounds as they are in tournaments.json, without reading predictions"""
+        if not os.path.exists(self.tournaments_file):
+            return {}
+        return self._load_json(self.tournaments_file)["rounds"]
+
+    def save_tournament(self, tournament: Dict):
+        self._data["tournaments"][tournament["id"]] = copy.deepcopy(tournament)
+        self._dirty = True
+
+    def save_round(self, round_data: Dict):
+        matches = self._data["rounds"].get(round_data["id"], {}).get("matches", [])
+        self._data["rounds"][round_data["id"]] = dict(round_data, matches=matches)
+        self._dirty = True
+
+    def save_match(self, round_id: str, match_index: int, match: Dict):
+        matches = self._data["rounds"][round_id]["matches"]
+        if match_index < len(matches):
+            matches[match_index] = dict(match)
+        else:
+            matches.append(dict(match))
+        self._dirty = True
+
+    def append_prediction(self, round_id: str, match_id: str, user_id: int, prediction: str):
+        if self._journal is None:
+            self._init_files()
+            self._open_journal()
+
+        record = json.dumps([round_id, match_id, user_id, prediction], ensure_ascii=False) + "\n"
+        self._journal.write(record)
+        size = len(record.encode('utf-8'))
+        self._journal_size += size
+        metrics.inc("storage_bytes_written_total", size)
+
+        if self._journal_size >= self.journal_compact_bytes:
+            self._start_compaction()
+
+    def delete_round(self, round_id: str):
+        self._data["rounds"].pop(round_id, None)
+        self._dirty = True
+        # A record without a match drops the round's predictions on replay
+        self.append_prediction(round_id, None, None, None)
+
+    def write_snapshot(self, data: Dict, predictions: Dict):
+        """Replace the files with the given state"""
+        self._data = data
+        self._init_files()
+        self._save_json(self.tournaments_file, data)
+        self._save_json(self.predictions_file, predictions)
+
+    def flush(self):
+        if self._dirty:
+            self._init_files()
+            self._save_json(self.tournaments_file, self._data)
+            self._dirty = False
+        if self._journal:
+            self._journal.flush()
+
+    def close(self):
+        self.flush()
+        self._close_journal()
+
+    # Prediction journal
+    def _replay_journal(self, filepath, predictions: Dict):
+        """Apply journal records on top of loaded predictions"""
+        if not os.path.exists(filepath):
+            return
+
+        metrics.inc("storage_bytes_read_total", os.path.getsize(filepath))
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    round_id, match_id, user_id, prediction = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash, the records around it are intact
+                    continue
+                if match_id is None:
+                    predictions.pop(round_id, None)
+                    continue
+                predictions.setdefault(round_id, {}).setdefault(str(user_id), {})[match_id] = prediction
+
+    @staticmethod
+    def _truncate_torn_record(filepath):
+        """Cut a file back to its last complete line, so appended records start on a line of their own"""
+        if not os.path.exists(filepath):
+            return
+        with open(filepath, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                start = max(0, pos - 4096)
+                f.seek(start)
+                newline = f.read(pos - start).rfind(b"\n")
+                if newline >= 0:
+                    pos = start + newline + 1
+                    break
+                pos = start
+            if pos < end:
+                f.truncate(pos)
+
+    def _open_journal(self):
+        self._truncate_torn_record(self.journal_file)
+        self._journal = open(self.journal_file, 'a', encoding='utf-8')
+        self._journal_size = os.path.getsize(self.journal_file)
+
+    def _close_journal(self):
+        if self._compaction:
+            self._compaction.join()
+            self._compaction = None
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    def _start_compaction(self):
+        """Rotate the journal and fold it into predictions.json in the background"""
+        if self._compaction and self._compaction.is_alive():
+            return
+
+        rotated_file = self.journal_file + ".1"
+        self._journal.close()
+        if os.path.exists(rotated_file):
+            # The previous compaction failed, keep its records ahead of ours
+            self._truncate_torn_record(rotated_file)
+            with open(self.journal_file, 'rb') as src, open(rotated_file, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.journal_file)
+        else:
+            os.replace(self.journal_file, rotated_file)
+        self._open_journal()
+
+        # Only the files are involved, new records keep going to the fresh journal
+        def compact():
+            snapshot = self._load_json(self.predictions_file) if os.path.exists(self.predictions_file) else {}
+            self._replay_journal(rotated_file, snapshot)
+            self._save_json(self.predictions_file, snapshot)
+            os.remove(rotated_file)
+
+        self._compaction = threading.Thread(target=compact, name="journal-compaction", daemon=True)
+        self._compaction.start()
+
+
+class JsonStorage(Storage):
+    """One directory of JSON files per guild, under data/guilds/<guild_id>/"""
+
+    def __init__(self, data_dir="data", journal_compact_bytes=JOURNAL_COMPACT_BYTES):
+        self.data_dir = data_dir
+        self.guilds_dir = os.path.join(data_dir, "guilds")
+        if not os.path.exists(self.guilds_dir):
+            os.makedirs(self.guilds_dir)
+        self.journal_compact_bytes = journal_compact_bytes
+
+        self._files = {}  # guild_id -> JsonGuildFiles of loaded guilds
+        self._dirty_guilds = set()
+
+        self._split_legacy_files()
+
+    def _guild_files(self, guild_id: int) -> JsonGuildFiles:
+        return JsonGuildFiles(os.path.join(self.guilds_dir, str(guild_id)), self.journal_compact_bytes)
+
+    def _split_legacy_files(self):
+        """Move data from the old shared tournaments.json/predictions.json into per-guild files"""
+        if not os.path.exists(os.path.join(self.data_dir, "tournaments.json")):
+            return
+
+        legacy = JsonGuildFiles(self.data_dir, self.journal_compact_bytes)
+        data, predictions = legacy.load()
+        legacy.close()
+
+        guilds = {}
+        for tournament_id, tournament in data["tournaments"].items():
+            guild_data, _ = guilds.setdefault(tournament["guild_id"], ({"tournaments": {}, "rounds": {}}, {}))
+            guild_data["tournaments"][tournament_id] = tournament
+        for round_id, round_data in data["rounds"].items():
+            guild_data, guild_predictions = guilds.setdefault(round_data["guild_id"], ({"tournaments": {}, "rounds": {}}, {}))
+            guild_data["rounds"][round_id] = round_data
+            if round_id in predictions:
+                guild_predictions[round_id] = predictions[round_id]
+
+        for guild_id, (guild_data, guild_predictions) in guilds.items():
+            self._guild_files(guild_id).write_snapshot(guild_data, guild_predictions)
+
+        # Keep the old files around instead of deleting them
+        legacy_dir = os.path.join(self.data_dir, "legacy")
+        if not os.path.exists(legacy_dir):
+            os.makedirs(legacy_dir)
+        for filepath in (legacy.tournaments_file, legacy.predictions_file, legacy.journal_file):
+            if os.path.exists(filepath):
+                os.replace(filepath, os.path.join(legacy_dir, os.path.basename(filepath)))
+
+        print(f"Split legacy data files into {len(guilds)} guild(s)")
+
+    def load_guild(self, guild_id: int) -> Tuple[Dict, Dict]:
+        files = self._files[guild_id] = self._guild_files(guild_id)
+        return files.load()
+
+    def unload_guild(self, guild_id: int):
+        files = self._files.pop(guild_id, None)
+        if files:
+            files.close()
+        self._dirty_guilds.discard(guild_id)
+
+    def guild_ids(self) -> List[int]:
+        return [int(name) for name in os.listdir(self.guilds_dir) if name.isdigit()]
+
+    def finished_rounds(self, before: str) -> List[Tuple[int, str]]:
+        found = []
+        for guild_id in self.guild_ids():
+            files = self._files.get(guild_id)
+            rounds = files.rounds() if files else self._guild_files(guild_id).stored_rounds()
+            found.extend((guild_id, round_id) for round_id, round_data in rounds.items()
+                         if round_finished_before(round_data, before))
+        return found
+
+    def save_tournament(self, tournament: Dict):
+        self._files[tournament["guild_id"]].save_tournament(tournament)
+        self._dirty_guilds.add(tournament["guild_id"])
+
+    def save_round(self, round_data: Dict):
+        self._files[round_data["guild_id"]].save_round(round_data)
+        self._dirty_guilds.add(round_data["guild_id"])
+
+    def save_match(self, guild_id: int, round_id: str, match_index: int, match: Dict):
+        self._files[guild_id].save_match(round_id, match_index, match)
+        self._dirty_guilds.add(guild_id)
+
+    def save_prediction(self, guild_id: int, round_id: str, match_id: str, user_id: int, prediction: str):
+        self._files[guild_id].append_prediction(round_id, match_id, user_id, prediction)
+        self._dirty_guilds.add(guild_id)
+
+    def delete_round(self, guild_id: int, round_id: str):
+        self._files[guild_id].delete_round(round_id)
+        self._dirty_guilds.add(guild_id)
+
+    def flush(self):
+        # Only guilds changed since the last flush are touched
+        for guild_id in self._dirty_guilds:
+            self._files[guild_id].flush()
+        self._dirty_guilds.clear()
+
+    def close(self):
+        for files in self._files.values():
+            files.close()
+        self._files = {}
+        self._dirty_guilds.clear()
+
+
+class SqliteStorage(Storage):
+    """Single SQLite database in WAL mode"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tournaments (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        guild_id INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        active INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS rounds (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        guild_id INTEGER NOT NULL,
+        tournament_id TEXT,
+        created_at TEXT NOT NULL,
+        active INTEGER NOT NULL,
+        predictions_open INTEGER NOT NULL,
+        finished_at TEXT
+    );
+    CREATE TABLE IF NOT EXISTS matches (
+        id TEXT PRIMARY KEY,
+        round_id TEXT NOT NULL,
+        match_index INTEGER NOT NULL,
+        team1 TEXT NOT NULL,
+        team2 TEXT NOT NULL,
+        result TEXT,
+        message_id INTEGER,
+        channel_id INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS predictions (
+        round_id TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        match_id TEXT NOT NULL,
+        prediction TEXT NOT NULL,
+        PRIMARY KEY (round_id, user_id, match_id)
+    );
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tournaments_guild ON tournaments (guild_id);
+    CREATE INDEX IF NOT EXISTS idx_rounds_guild ON rounds (guild_id);
+    CREATE INDEX IF NOT EXISTS idx_rounds_tournament ON rounds (tournament_id);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_matches_round ON matches (round_id, match_index);
+    CREATE INDEX IF NOT EXISTS idx_matches_message ON matches (message_id);
+    CREATE INDEX IF NOT EXISTS idx_predictions_user ON predictions (user_id);
+    CREATE INDEX IF NOT EXISTS idx_predictions_match ON predictions (match_id);
+    """
+
+    def __init__(self, data_dir="data"):
+        self.data_dir = data_dir
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+
+        self.db_file = os.path.join(data_dir, "predictions.db")
+
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._upgrade_schema()
+
+        has_json = (os.path.exists(os.path.join(data_dir, "tournaments.json"))
+                    or os.path.exists(os.path.join(data_dir, "guilds")))
+        if has_json and not self._migrated():
+            migrate_json_to_sqlite(JsonStorage(data_dir), self)
+
+    def _migrated(self) -> bool:
+        """Check whether the JSON files were migrated already.
+
+        The marker is committed together with the migrated data, so an
+        interrupted migration leaves neither and runs again on the next start.
+        """
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return True
+        # Databases from before the marker existed: any data means they were migrated
+        if self.conn.execute("SELECT 1 FROM tournaments UNION ALL SELECT 1 FROM rounds LIMIT 1").fetchone():
+            self.mark_migrated()
+            self.flush()
+            return True
+        return False
+
+    def mark_migrated(self):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                          (datetime.now().isoformat(),))
+
+    def _upgrade_schema(self):
+        """Add columns introduced after a database was created"""
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(matches)")]
+        if "channel_id" not in columns:
+            self.conn.execute("ALTER TABLE matches ADD COLUMN channel_id INTEGER")
+            self.conn.commit()
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(rounds)")]
+        if "finished_at" not in columns:
+            self.conn.execute("ALTER TABLE rounds ADD COLUMN finished_at TEXT")
+            self.conn.commit()
+
+    def guild_ids(self) -> List[int]:
+        rows = self.conn.execute("SELECT guild_id FROM tournaments UNION SELECT guild_id FROM rounds")
+        return [guild_id for (guild_id,) in rows]
+
+    def finished_rounds(self, before: str) -> List[Tuple[int, str]]:
+        rows = self.conn.execute(
+            "SELECT guild_id, id FROM rounds r WHERE predictions_open = 0 AND (finished_at <= ? OR "
+            "(finished_at IS NULL AND NOT EXISTS (SELECT 1 FROM matches m WHERE m.round_id = r.id AND m.result IS NULL)))",
+            (before,)
+        )
+        return [(guild_id, round_id) for guild_id, round_id in rows]
+
+    def load_guild(self, guild_id: int) -> Tuple[Dict, Dict]:
+        data = {"tournaments": {}, "rounds": {}}
+        predictions = {}
+
+        for tournament_id, name, guild_id, created_at, active in self.conn.execute(
+            "SELECT id, name, guild_id, created_at, active FROM tournaments WHERE guild_id = ? ORDER BY rowid",
+            (guild_id,)
+        ):
+            data["tournaments"][tournament_id] = {
+                "id": tournament_id,
+                "name": name,
+                "guild_id": guild_id,
+                "created_at": created_at,
+                "rounds": [],
+                "active": bool(active)
+            }
+
+        rounds = self.conn.execute(
+            "SELECT id, name, guild_id, tournament_id, created_at, active, predictions_open, finished_at FROM rounds "
+            "WHERE guild_id = ? ORDER BY rowid",
+            (guild_id,)
+        )
+        for round_id, name, guild_id, tournament_id, created_at, active, predictions_open, finished_at in rounds:
+            data["rounds"][round_id] = {
+                "id": round_id,
+                "name": name,
+                "guild_id": guild_id,
+                "tournament_id": tournament_id,
+                "created_at": created_at,
+                "matches": [],
+                "active": bool(active),
+                "predictions_open": bool(predictions_open),
+                "finished_at": finished_at
+            }
+            if tournament_id in data["tournaments"]:
+                data["tournaments"][tournament_id]["rounds"].append(round_id)
+
+        for match_id, round_id, team1, team2, result, message_id, channel_id in self.conn.execute(
+            "SELECT id, round_id, team1, team2, result, message_id, channel_id FROM matches "
+            "WHERE round_id IN (SELECT id FROM rounds WHERE guild_id = ?) ORDER BY round_id, match_index",
+            (guild_id,)
+        ):
+            data["rounds"][round_id]["matches"].append({
+                "id": match_id,
+                "team1": team1,
+                "team2": team2,
+                "result": result,
+                "message_id": message_id,
+                "channel_id": channel_id
+            })
+
+        for round_id, user_id, match_id, prediction in self.conn.execute(
+            "SELECT p.round_id, p.user_id, p.match_id, p.prediction FROM predictions p "
+            "JOIN rounds r ON r.id = p.round_id WHERE r.guild_id = ? ORDER BY p.rowid",
+            (guild_id,)
+        ):
+            predictions.setdefault(round_id, {}).setdefault(str(user_id), {})[match_id] = prediction
+
+        return data, predictions
+
+    def save_tournament(self, tournament: Dict):
+        self.conn.execute(
+            "INSERT INTO tournaments (id, name, guild_id, created_at, active) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET name = excluded.name, active = excluded.active",
+            (tournament["id"], tournament["name"], tournament["guild_id"], tournament["created_at"],
+             tournament["active"])
+        )
+
+    def save_round(self, round_data: Dict):
+        self.conn.execute(
+            "INSERT INTO rounds (id, name, guild_id, tournament_id, created_at, active, predictions_open, finished_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET name = excluded.name, active = excluded.active, "
+            "predictions_open = excluded.predictions_open, finished_at = excluded.finished_at",
+            (round_data["id"], round_data["name"], round_data["guild_id"], round_data["tournament_id"],
+             round_data["created_at"], round_data["active"], round_data["predictions_open"],
+             round_data.get("finished_at"))
+        )
+
+    def save_match(self, guild_id: int, round_id: str, match_index: int, match: Dict):
+        self.conn.execute(
+            "INSERT INTO matches (id, round_id, match_index, team1, team2, result, message_id, channel_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET result = excluded.result, message_id = excluded.message_id, "
+            "channel_id = excluded.channel_id",
+            (match["id"], round_id, match_index, match["team1"], match["team2"], match["result"],
+             match["message_id"], match.get("channel_id"))
+        )
+
+    def save_prediction(self, guild_id: int, round_id: str, match_id: str, user_id: int, prediction: str):
+        self.conn.execute(
+            "INSERT INTO predictions (round_id, user_id, match_id, prediction) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (round_id, user_id, match_id) DO UPDATE SET prediction = excluded.prediction",
+            (round_id, user_id, match_id, prediction)
+        )
+
+    def delete_round(self, guild_id: int, round_id: str):
+        self.conn.execute("DELETE FROM predictions WHERE round_id = ?", (round_id,))
+        self.conn.execute("DELETE FROM matches WHERE round_id = ?", (round_id,))
+        self.conn.execute("DELETE FROM rounds WHERE id = ?", (round_id,))
+
+    def flush(self):
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def calculate_scores(self, guild_id: int, round_ids: List[str]) -> Optional[List[Tuple[int, int, int]]]:
+        placeholders = ", ".join("?" * len(round_ids))
+        return self.conn.execute(
+            "SELECT p.user_id, SUM(p.prediction = m.result), COUNT(*) "
+            "FROM predictions p JOIN matches m ON m.id = p.match_id AND m.round_id = p.round_id "
+            f"WHERE p.round_id IN ({placeholders}) AND m.result IS NOT NULL "
+            "GROUP BY p.user_id ORDER BY MIN(p.rowid)",
+            round_ids
+        ).fetchall()
+
+
+def migrate_json_to_sqlite(source: JsonStorage, target: SqliteStorage):
+    """Copy everything from the JSON files into an SQLite database"""
+    guild_ids = source.guild_ids()
+    for guild_id in guild_ids:
+        data, predictions = source.load_guild(guild_id)
+        source.unload_guild(guild_id)
+
+        for tournament in data["tournaments"].values():
+            target.save_tournament(tournament)
+        for round_id, round_data in data["rounds"].items():
+            target.save_round(round_data)
+            for idx, match in enumerate(round_data["matches"]):
+                target.save_match(guild_id, round_id, idx, match)
+        for round_id, users in predictions.items():
+            for user_id, user_predictions in users.items():
+                for match_id, prediction in user_predictions.items():
+                    target.save_prediction(guild_id, round_id, match_id, int(user_id), prediction)
+    source.close()
+    # Committed in the same transaction as the data
+    target.mark_migrated()
+    target.flush()
+
+    print(f"Migrated {len(guild_ids)} guild(s) to SQLite")
+
+
+def create_storage(backend: str, data_dir="data") -> Storage:
+    """Create the storage backend selected by name ("json" or "sqlite")"""
+    if backend == "json":
+        return JsonStorage(data_dir)
+    if backend == "sqlite":
+        return SqliteStorage(data_dir)
+    raise ValueError(f"Unknown storage backend: {backend}")
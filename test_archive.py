@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from data_manager import DataManager
+
+GUILD_ID = 1
+DAY = 24 * 60 * 60
+
+
+def finished_round(dm: DataManager, created_days_ago: float) -> str:
+    round_id = dm.next_round_id(GUILD_ID)
+    dm.create_round(round_id, "Round", GUILD_ID)
+    dm.add_match(round_id, "Navi", "Vitality")
+    dm.save_prediction(round_id, f"{round_id}_match_0", 5, "team1")
+    dm.close_predictions(round_id)
+    dm.set_match_result(round_id, 0, "team1")
+    # Rounds can run for weeks before they finish
+    dm._guilds[GUILD_ID].rounds[round_id].created_at = (datetime.now() - timedelta(days=created_days_ago)).isoformat()
+    return round_id
+
+
+def test_archive_counts_from_finish(tmp_path):
+    dm = DataManager(str(tmp_path / "data"))
+    round_id = finished_round(dm, created_days_ago=60)
+
+    assert dm.archive_rounds(30 * DAY) == 0
+
+    round_data = dm._guilds[GUILD_ID].rounds[round_id]
+    round_data.finished_at = (datetime.now() - timedelta(days=31)).isoformat()
+    dm.storage.save_round(round_data.to_dict())
+    assert dm.archive_rounds(30 * DAY) == 1
+    assert dm.get_round_leaderboard(round_id)[0]["user_id"] == 5
+    dm.close()
+
+
+def test_archive_unloaded_guilds(tmp_path):
+    dm = DataManager(str(tmp_path / "data"))
+    round_id = finished_round(dm, created_days_ago=0)
+    dm.evict_idle_guilds(0)
+
+    # Nothing to archive yet, so the guild isn't even loaded
+    loads = []
+    load_guild = dm._load_guild
+    dm._load_guild = lambda guild_id: loads.append(guild_id) or load_guild(guild_id)
+    assert dm.archive_rounds(DAY) == 0
+    assert loads == []
+    assert dm.loaded_guild_ids() == []
+
+    assert dm.archive_rounds(0) == 1
+    assert round_id in dm.loaded_guild(GUILD_ID).archived_rounds
+    dm.close()
+
+
+def test_reopened_round_isnt_finished(tmp_path):
+    dm = DataManager(str(tmp_path / "data"))
+    round_id = finished_round(dm, created_days_ago=0)
+    assert dm.get_round(round_id)["finished_at"] is not None
+
+    dm.add_match(round_id, "FaZe", "G2")
+    assert dm.get_round(round_id)["finished_at"] is None
+    assert dm.archive_rounds(0) == 0
+    dm.close()
@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+from async_data_manager import AsyncDataManager
+from catchup import ReactionCatchUp
+from data_manager import DataManager
+
+GUILD_ID = 1
+CHANNEL_ID = 10
+BOT_USER_ID = 999
+EMOJIS = {"✅": "team1", "❌": "team2"}
+
+
+class FakeReaction:
+    def __init__(self, emoji: str, user_ids):
+        self.emoji = emoji
+        self.count = len(user_ids)
+        self._user_ids = user_ids
+
+    async def users(self, limit=None):
+        for user_id in self._user_ids:
+            yield SimpleNamespace(id=user_id)
+
+
+class FakeChannel:
+    def __init__(self, client):
+        self.client = client
+
+    async def fetch_message(self, message_id: int):
+        if self.client.on_fetch is not None:
+            await self.client.on_fetch()
+        return SimpleNamespace(reactions=self.client.reactions[message_id])
+
+
+class FakeClient:
+    """Just enough of discord.Client for reading reactions back"""
+
+    def __init__(self, reactions, on_fetch=None):
+        self.user = SimpleNamespace(id=BOT_USER_ID)
+        self.reactions = reactions  # message_id -> [FakeReaction]
+        self.on_fetch = on_fetch
+
+    def get_partial_messageable(self, channel_id: int):
+        return FakeChannel(self)
+
+
+def setup_round(tmp_path):
+    dm = AsyncDataManager(DataManager(str(tmp_path / "data")))
+    round_id = dm.dm.next_round_id(GUILD_ID)
+    dm.dm.create_round(round_id, "Round", GUILD_ID)
+    match = dm.dm.add_match(round_id, "Navi", "Vitality")
+    dm.dm.set_match_message_id(round_id, 0, 100, CHANNEL_ID)
+    reactions = {100: [FakeReaction("✅", [1, 2, BOT_USER_ID]), FakeReaction("❌", [3, BOT_USER_ID])]}
+    return dm, round_id, match["id"], reactions
+
+
+def test_catchup_saves_missed_votes(tmp_path):
+    async def scenario():
+        dm, round_id, match_id, reactions = setup_round(tmp_path)
+        saved = await ReactionCatchUp(FakeClient(reactions), dm, EMOJIS).run([GUILD_ID])
+        predictions = await dm.get_all_predictions(round_id)
+        await dm.close()
+        return saved, predictions, match_id
+
+    saved, predictions, match_id = asyncio.run(scenario())
+    assert saved == 3
+    assert {user_id: votes[match_id] for user_id, votes in predictions.items()} == {
+        "1": "team1", "2": "team1", "3": "team2"
+    }
+
+
+def test_catchup_skips_round_closed_while_reading(tmp_path):
+    async def scenario():
+        dm, round_id, _, reactions = setup_round(tmp_path)
+
+        async def close_round():
+            async with dm.round_lock(round_id):
+                await dm.close_predictions(round_id)
+
+        saved = await ReactionCatchUp(FakeClient(reactions, on_fetch=close_round), dm, EMOJIS).run([GUILD_ID])
+        predictions = await dm.get_all_predictions(round_id)
+        await dm.close()
+        return saved, predictions
+
+    saved, predictions = asyncio.run(scenario())
+    assert saved == 0
+    assert not predictions
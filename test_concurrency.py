@@ -0,0 +1,128 @@
+import asyncio
+import importlib
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from async_data_manager import AsyncDataManager
+from data_manager import DataManager
+
+GUILD_ID = 1
+ROUNDS = 3
+MATCHES_PER_ROUND = 4
+USERS = 500
+VOTES = 6000
+
+
+class FakeRemovals:
+    """Stands in for ReactionRemovalQueue and records removals instead of calling Discord"""
+
+    def __init__(self):
+        self.removed = []
+
+    def remove(self, channel_id, message_id, emoji, user_id):
+        self.removed.append((message_id, emoji, user_id))
+
+
+class FakeResponse:
+    async def send_message(self, content=None, embed=None, ephemeral=False):
+        pass
+
+
+@pytest.fixture
+def bot_module(tmp_path, monkeypatch):
+    # bot.py opens ./data on import
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module("bot")
+    monkeypatch.setattr(module, "dm", AsyncDataManager(DataManager(str(tmp_path / "votes")), batch_size=50))
+    monkeypatch.setattr(module, "reaction_removals", FakeRemovals())
+    monkeypatch.setattr(module.bot._connection, "user", SimpleNamespace(id=0))
+    return module
+
+
+async def setup_rounds(dm: AsyncDataManager):
+    """Create the rounds and post their matches, returns [(round_id, match_id, message_id)]"""
+    messages = []
+    for _ in range(ROUNDS):
+        round_id = await dm.next_round_id(GUILD_ID)
+        await dm.create_round(round_id, "Round", GUILD_ID)
+        matches = await dm.add_matches(round_id, [("Navi", "Vitality")] * MATCHES_PER_ROUND)
+        message_ids = {idx: len(messages) + idx + 1 for idx in range(len(matches))}
+        await dm.set_match_message_ids(round_id, message_ids, GUILD_ID)
+        messages.extend((round_id, match["id"], message_ids[idx]) for idx, match in enumerate(matches))
+    return messages
+
+
+def test_concurrent_votes_with_close(bot_module, tmp_path):
+    rng = random.Random(7)
+    dm = bot_module.dm
+    events = []  # ("vote", round_id, match_id, user_id, prediction) and ("close", round_id), in order
+
+    submit_prediction = dm.submit_prediction
+
+    def record_vote(round_id, match_id, user_id, prediction):
+        events.append(("vote", round_id, match_id, user_id, prediction))
+        submit_prediction(round_id, match_id, user_id, prediction)
+
+    close_predictions = dm.close_predictions
+    at_close = {}
+
+    async def record_close(round_id):
+        await close_predictions(round_id)
+        events.append(("close", round_id))
+        # What was written by the time the round closed, leaving the queue alone
+        at_close.update(await dm._run(dm.dm.get_all_predictions, round_id))
+
+    dm.submit_prediction = record_vote
+    dm.close_predictions = record_close
+
+    async def scenario():
+        messages = await setup_rounds(dm)
+        closed_round = messages[0][0]
+
+        tasks = []
+        for i in range(VOTES):
+            if i == VOTES // 2:
+                interaction = SimpleNamespace(response=FakeResponse())
+                tasks.append(asyncio.ensure_future(bot_module.close_predictions.callback(interaction, closed_round)))
+            _, _, message_id = rng.choice(messages)
+            # Few users, so the same user often votes on the same match concurrently
+            payload = SimpleNamespace(user_id=rng.randrange(1, USERS + 1),
+                                      emoji=rng.choice((bot_module.TEAM1_EMOJI, bot_module.TEAM2_EMOJI)),
+                                      guild_id=GUILD_ID, channel_id=GUILD_ID, message_id=message_id)
+            tasks.append(asyncio.ensure_future(bot_module.on_raw_reaction_add(payload)))
+        await asyncio.gather(*tasks)
+        await dm.close()
+        return messages, closed_round
+
+    messages, closed_round = asyncio.run(scenario())
+
+    close_at = events.index(("close", closed_round))
+    late_votes = [event for event in events[close_at:] if event[0] == "vote" and event[1] == closed_round]
+    assert not late_votes
+    # Votes on the other rounds kept going after the close, and the closed round turned votes away
+    assert any(event[0] == "vote" for event in events[close_at:])
+    assert bot_module.reaction_removals.removed
+
+    accepted = {}
+    for event in events:
+        if event[0] == "vote":
+            _, round_id, match_id, user_id, prediction = event
+            accepted[(round_id, match_id, user_id)] = prediction
+
+    # Read back from disk, every accepted vote is there and nothing else
+    stored = {}
+    reloaded = DataManager(str(tmp_path / "votes"))
+    for round_id in {round_id for round_id, _, _ in messages}:
+        for user_id, predictions in reloaded.get_all_predictions(round_id).items():
+            for match_id, prediction in predictions.items():
+                stored[(round_id, match_id, int(user_id))] = prediction
+    reloaded.close()
+    assert stored == accepted
+    # Accepted votes were written before the close, not after it
+    assert {(closed_round, match_id, int(user_id)): prediction
+            for user_id, predictions in at_close.items()
+            for match_id, prediction in predictions.items()} == {
+        key: prediction for key, prediction in stored.items() if key[0] == closed_round
+    }
@@ -0,0 +1,23 @@
+from async_data_manager import AsyncDataManager
+from data_manager import DataManager
+
+GUILD_ID = 1
+
+
+def test_autocomplete_only_reads_loaded_guilds(tmp_path):
+    dm = AsyncDataManager(DataManager(str(tmp_path / "data")))
+    round_id = dm.dm.next_round_id(GUILD_ID)
+    dm.dm.create_round(round_id, "Grand Final", GUILD_ID)
+    tournament_id = dm.dm.next_tournament_id(GUILD_ID)
+    dm.dm.create_tournament(tournament_id, "Major", GUILD_ID)
+
+    # Served from the in-memory index without going through the worker thread
+    assert dm.search_rounds(GUILD_ID, "fin") == [{"id": round_id, "name": "Grand Final", "status": "open"}]
+    assert dm.search_tournaments(GUILD_ID, "maj") == [{"id": tournament_id, "name": "Major"}]
+
+    # An evicted guild isn't loaded back for a keystroke
+    dm.dm.evict_idle_guilds(0)
+    assert dm.search_rounds(GUILD_ID, "fin") == []
+    assert dm.search_tournaments(GUILD_ID, "maj") == []
+    assert dm.dm.loaded_guild_ids() == []
+    dm.dm.close()
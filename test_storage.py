@@ -0,0 +1,46 @@
+import os
+
+from data_manager import DataManager
+from storage import JsonStorage
+
+GUILD_ID = 1
+
+
+def journal_path(data_dir) -> str:
+    return os.path.join(data_dir, "guilds", str(GUILD_ID), "predictions.journal")
+
+
+def votes(dm: DataManager, round_id: str):
+    return {user_id: predictions[f"{round_id}_match_0"]
+            for user_id, predictions in dm.get_all_predictions(round_id).items()}
+
+
+def test_votes_after_torn_journal_record_survive(tmp_path):
+    data_dir = str(tmp_path / "data")
+    dm = DataManager(data_dir)
+    round_id = dm.next_round_id(GUILD_ID)
+    dm.create_round(round_id, "Round", GUILD_ID)
+    dm.add_match(round_id, "Navi", "Vitality")
+    dm.save_prediction(round_id, f"{round_id}_match_0", 10, "team1")
+    dm.close()
+
+    # A crash in the middle of appending a record
+    with open(journal_path(data_dir), 'a', encoding='utf-8') as f:
+        f.write(f'["{round_id}", "{round_id}_match_0", 11, "te')
+
+    dm = DataManager(data_dir)
+    dm.save_prediction(round_id, f"{round_id}_match_0", 12, "team2")
+    dm.save_prediction(round_id, f"{round_id}_match_0", 13, "team1")
+    dm.close()
+
+    dm = DataManager(data_dir)
+    assert votes(dm, round_id) == {"10": "team1", "12": "team2", "13": "team1"}
+    dm.close()
+
+    # Compaction folds the journal into predictions.json without losing them either
+    dm = DataManager(data_dir, storage=JsonStorage(data_dir, journal_compact_bytes=1))
+    dm.save_prediction(round_id, f"{round_id}_match_0", 14, "team2")
+    dm.close()
+    dm = DataManager(data_dir)
+    assert votes(dm, round_id) == {"10": "team1", "12": "team2", "13": "team1", "14": "team2"}
+    dm.close()